@@ -0,0 +1,635 @@
+"""Load benchmark for server.py.
+
+Builds synthetic submissions databases from the real form vocabularies
+(data.json plus the select/checkbox options in the data form), starts
+server.py against a copy of each one in a child process and drives
+/api/submit, /api/records and /api/export over HTTP.
+
+    python benchmark.py                       # 10k and 100k rows
+    python benchmark.py --sizes 250000 --output before.json
+    python benchmark.py --baseline before.json
+
+Each size runs every scenario with server.py's result cache off, then the
+read scenarios again with it on; the two are reported separately because
+repeated URLs make the second pass mostly cache hits.
+
+Generated databases only depend on the size and --seed, so two runs on
+different commits measure the same data. --server-dir points the child at
+another checkout's server.py to compare versions with one harness.
+"""
+import argparse
+import base64
+import http.client
+import json
+import logging
+import os
+import platform
+import random
+import shutil
+import sqlite3
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+import urllib.parse
+from datetime import date, datetime, timedelta
+from html.parser import HTMLParser
+
+try:
+    import resource  # Unix only: peak RSS of the server process
+except ImportError:
+    resource = None
+
+APP_DIR = os.path.dirname(os.path.abspath(__file__))
+DATA_JSON_PATH = os.path.join(APP_DIR, 'data.json')
+HTML_FORM_PATH = os.path.join(APP_DIR, 'WomensHealth_DataForm.html')
+DEFAULT_SIZES = '10000,100000'
+DEFAULT_DATA_DIR = os.path.join(tempfile.gettempdir(), 'womenshealth-bench')
+GENERATOR_VERSION = 2       # Bump when generate_record or BASE_SCHEMA changes so cached databases are rebuilt
+BUILD_BATCH_SIZE = 5000
+PER_PAGE = 50
+DATE_END = date(2025, 12, 31)
+DATE_YEARS = 5
+STAFF_NAMES = [
+    'Jane Doe', 'Mary Smith', 'Aroha Ngata', 'Priya Patel', 'Sarah Nguyen', 'Emma Wilson',
+    'Olivia Brown', 'Fatima Hassan', 'Grace Taylor', 'Chloe Martin', 'Mei Chen', 'Lucy Walker',
+    'Hannah White', 'Zoe Harris', 'Ruby Thompson', 'Isla Kelly', 'Amelia King', 'Leila Haddad',
+]
+
+# Every column the form fills in, in the order server.py binds them.
+SUBMISSION_FIELDS = [
+    'session_date', 'client_id', 'staff_member', 'client_status', 'visit_number', 'age', 'carer', 'financial_hardship', 'social_isolation', 'rural_postcode', 'lgbtiq',
+    'funding_stream', 'funding_option', 'contact_mode',
+    'country', 'language', 'income_source', 'visa_type', 'ethnicity',
+    'disability', 'chronic_illness', 'presenting_issues', 'service_provided',
+    'service_type', 'practitioner', 'group_type', 'evaluation_tools'
+]
+
+# The original submissions table, column for column: the CREATE TABLE plus
+# the ALTER TABLE additions in the order server.py first applied them, so
+# any version of server.py can open (and migrate) the generated database.
+BASE_SCHEMA = '''
+    CREATE TABLE submissions (
+        id INTEGER PRIMARY KEY AUTOINCREMENT,
+        submitted_at TEXT NOT NULL DEFAULT (datetime('now','localtime')),
+        session_date TEXT NOT NULL,
+        client_id TEXT,
+        age TEXT,
+        contact_mode TEXT,
+        country TEXT,
+        language TEXT,
+        income_source TEXT,
+        visa_type TEXT,
+        ethnicity TEXT,
+        disability TEXT,
+        chronic_illness TEXT,
+        presenting_issues TEXT,
+        service_provided TEXT,
+        service_type TEXT,
+        practitioner TEXT,
+        group_type TEXT,
+        evaluation_tools TEXT,
+        staff_member TEXT,
+        client_status TEXT,
+        visit_number TEXT,
+        carer TEXT DEFAULT 'No',
+        financial_hardship TEXT DEFAULT 'No',
+        social_isolation TEXT DEFAULT 'No',
+        rural_postcode TEXT DEFAULT 'No',
+        lgbtiq TEXT DEFAULT 'No',
+        funding_stream TEXT,
+        funding_option TEXT
+    )
+'''
+
+# field: (chance of choosing anything, most options picked, chance an extra
+# pick stays in the first pick's category). Picks cluster by category the
+# way they do on the form, e.g. several Addiction issues together.
+MULTI_SELECT_SHAPE = {
+    'ethnicity': (0.95, 2, 0.9),
+    'visa_type': (0.2, 1, 1.0),
+    'disability': (0.3, 2, 0.5),
+    'chronic_illness': (0.35, 3, 0.6),
+    'presenting_issues': (1.0, 4, 0.8),
+    'service_provided': (0.9, 3, 0.7),
+    'service_type': (0.9, 2, 0.8),
+    'practitioner': (0.95, 2, 0.7),
+    'group_type': (0.0, 2, 0.5),        # Only for group sessions, see generate_record
+    'evaluation_tools': (0.4, 2, 0.5),
+}
+YES_NO_RATES = {
+    'carer': 0.15, 'financial_hardship': 0.3, 'social_isolation': 0.2,
+    'rural_postcode': 0.25, 'lgbtiq': 0.1,
+}
+
+# ---------------------------------------------------------------------------
+# Vocabularies and synthetic records
+# ---------------------------------------------------------------------------
+
+class FormOptionParser(HTMLParser):
+    """Collects <select> options and checkbox/radio values by field name."""
+
+    def __init__(self):
+        super().__init__()
+        self.options = {}
+        self._select = None
+
+    def handle_starttag(self, tag, attrs):
+        attrs = dict(attrs)
+        if tag == 'select':
+            self._select = attrs.get('name') or attrs.get('id')
+        elif tag == 'option' and self._select and attrs.get('value'):
+            self.options.setdefault(self._select, []).append(attrs['value'])
+        elif tag == 'input' and attrs.get('type') in ('checkbox', 'radio') and attrs.get('name'):
+            self.options.setdefault(attrs['name'], []).append(attrs.get('value', ''))
+
+    def handle_endtag(self, tag):
+        if tag == 'select':
+            self._select = None
+
+def leaf_values(node):
+    """Every selectable value under one data.json entry (tiers flattened)."""
+    if isinstance(node, str):
+        return [node]
+    if isinstance(node, list):
+        return [v for child in node for v in leaf_values(child)]
+    if 'value' in node:
+        return [node['value']]
+    return [v for key, child in node.items() if key not in ('tier1', 'name', 'group', 'label')
+            for v in leaf_values(child)]
+
+def load_vocabularies():
+    """Field -> list of option groups; flat lists become a single group."""
+    with open(DATA_JSON_PATH, 'r', encoding='utf-8') as f:
+        data = json.load(f)
+    vocab = {}
+    for field, entries in data.items():
+        groups = [leaf_values(entry) for entry in entries]
+        if all(len(g) == 1 for g in groups):
+            groups = [[g[0] for g in groups]]
+        vocab[field] = [g for g in groups if g]
+
+    parser = FormOptionParser()
+    with open(HTML_FORM_PATH, 'r', encoding='utf-8') as f:
+        parser.feed(f.read())
+    for field, values in parser.options.items():
+        if field in SUBMISSION_FIELDS and field not in vocab and values:
+            vocab[field] = [list(dict.fromkeys(values))]
+    return vocab
+
+class WeightedChoice:
+    """Zipf-skewed picks over a stable, seed-shuffled popularity order."""
+
+    def __init__(self, rng, values, skew=1.1):
+        self.values = list(values)
+        rng.shuffle(self.values)
+        total = 0.0
+        self.cum_weights = []
+        for rank in range(1, len(self.values) + 1):
+            total += 1.0 / rank ** skew
+            self.cum_weights.append(total)
+
+    def pick(self, rng):
+        return rng.choices(self.values, cum_weights=self.cum_weights)[0]
+
+class RecordGenerator:
+    """Deterministic stream of realistic form submissions for one seed."""
+
+    def __init__(self, vocab, seed):
+        self.rng = random.Random(seed)
+        self.single = {}
+        self.multi = {}
+        for field, groups in vocab.items():
+            if field in MULTI_SELECT_SHAPE:
+                self.multi[field] = (WeightedChoice(self.rng, range(len(groups))),
+                                     [WeightedChoice(self.rng, g) for g in groups])
+            else:
+                self.single[field] = WeightedChoice(self.rng, [v for g in groups for v in g])
+        self.staff = WeightedChoice(self.rng, STAFF_NAMES, skew=0.6)
+        self.visits = {}
+        self.days = DATE_YEARS * 365
+
+    def pick_multi(self, field):
+        chance, most, same_group = MULTI_SELECT_SHAPE[field]
+        group_choice, groups = self.multi[field]
+        first_group = group_choice.pick(self.rng)
+        chosen = [groups[first_group].pick(self.rng)]
+        for _ in range(self.rng.randint(1, most) - 1):
+            group = first_group if self.rng.random() < same_group else group_choice.pick(self.rng)
+            chosen.append(groups[group].pick(self.rng))
+        return list(dict.fromkeys(chosen))
+
+    def generate_record(self, client_pool):
+        rng = self.rng
+        # Repeat clients are common: draw from a pool with a long tail
+        client = f"C{int(client_pool * rng.random() ** 2) + 1:06d}"
+        visit = self.visits.get(client, 0) + 1
+        self.visits[client] = visit
+        session_day = DATE_END - timedelta(days=rng.randrange(self.days))
+        if session_day.weekday() >= 5 and rng.random() < 0.8:
+            session_day -= timedelta(days=session_day.weekday() - 4)
+
+        record = {
+            'session_date': session_day.isoformat(),
+            'client_id': client,
+            'staff_member': self.staff.pick(rng),
+            'client_status': 'New' if visit == 1 else 'Returning',
+            'visit_number': '' if visit == 1 else str(visit),
+        }
+        for field in ('age', 'contact_mode', 'funding_stream', 'income_source'):
+            record[field] = self.single[field].pick(rng) if field in self.single else ''
+        record['funding_option'] = (self.single['funding_option'].pick(rng)
+                                    if record['funding_stream'] == 'Safety & Empowerment' else '')
+        record['country'] = 'Australia' if rng.random() < 0.7 else self.single['country'].pick(rng)
+        record['language'] = 'English' if rng.random() < 0.75 else self.single['language'].pick(rng)
+        for field, rate in YES_NO_RATES.items():
+            record[field] = 'Yes' if rng.random() < rate else 'No'
+        for field, (chance, _, _) in MULTI_SELECT_SHAPE.items():
+            if field == 'group_type':
+                chance = 1.0 if 'Group' in record['contact_mode'] else 0.0
+            record[field] = self.pick_multi(field) if field in self.multi and rng.random() < chance else []
+        return record
+
+def record_row(record):
+    return ['|'.join(v) if isinstance(v, list) else v for v in (record.get(f, '') for f in SUBMISSION_FIELDS)]
+
+def build_database(path, size, vocab, seed):
+    """Write `size` generated rows into a fresh database with the base schema."""
+    generator = RecordGenerator(vocab, seed)
+    client_pool = max(size // 4, 1)
+    tmp_path = path + '.partial'
+    if os.path.exists(tmp_path):
+        os.remove(tmp_path)
+    conn = sqlite3.connect(tmp_path)
+    try:
+        conn.execute(BASE_SCHEMA)
+        insert_sql = (f"INSERT INTO submissions (submitted_at, {', '.join(SUBMISSION_FIELDS)}) "
+                      f"VALUES (?, {', '.join(['?'] * len(SUBMISSION_FIELDS))})")
+        # Rows arrive in session order, as they would from the form
+        records = sorted((generator.generate_record(client_pool) for _ in range(size)),
+                         key=lambda r: r['session_date'])
+        for start in range(0, size, BUILD_BATCH_SIZE):
+            batch = records[start:start + BUILD_BATCH_SIZE]
+            conn.executemany(insert_sql, [[f"{r['session_date']} 12:00:00"] + record_row(r) for r in batch])
+        conn.commit()
+    finally:
+        conn.close()
+    os.replace(tmp_path, path)
+
+def cached_database(data_dir, size, vocab, seed):
+    """Path of the generated database for (size, seed), building it if needed."""
+    os.makedirs(data_dir, exist_ok=True)
+    path = os.path.join(data_dir, f"bench_v{GENERATOR_VERSION}_s{seed}_{size}.db")
+    if os.path.exists(path):
+        return path, 0.0
+    start = time.perf_counter()
+    build_database(path, size, vocab, seed)
+    return path, time.perf_counter() - start
+
+# ---------------------------------------------------------------------------
+# Server child process
+# ---------------------------------------------------------------------------
+
+def peak_rss_mb():
+    if resource is None:
+        return None
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    return round(peak / (1024 * 1024 if sys.platform == 'darwin' else 1024), 1)
+
+def serve_child(server_dir, db_path, result_cache):
+    """Entry point of the child: run server.py against db_path on a free port.
+
+    Skips the app lock, backups and the browser so it never touches the
+    real database or its archive. The result cache is on only when
+    result_cache is 'on'. Prints one JSON line when ready and one on shutdown.
+    """
+    work_dir = os.path.dirname(db_path)
+    logging.basicConfig(filename=os.path.join(work_dir, 'server.log'),
+                        level=logging.INFO, format='%(asctime)s - %(levelname)s - %(message)s')
+    sys.path.insert(0, server_dir)
+    import server
+    server.DB_PATH = db_path
+    if hasattr(server, 'ARCHIVE_DIR'):
+        server.ARCHIVE_DIR = os.path.join(work_dir, 'archive')
+    has_result_cache = hasattr(server, 'RESULT_CACHE')
+    if has_result_cache and result_cache != 'on':
+        # ResultCache() read the constant at import, so turn off the live instance too
+        server.RESULT_CACHE_ENTRIES = 0
+        server.RESULT_CACHE.max_entries = 0
+
+    start = time.perf_counter()
+    server.init_db()
+    startup = time.perf_counter() - start
+    cache = getattr(server, 'COLUMN_CACHE', None)
+    if cache is not None:
+        # run_server builds it in the background; wait so every scenario sees it ready
+        builder = cache.rebuild()
+        if builder is not None:
+            builder.join()
+    if hasattr(server, 'make_server'):
+        httpd = server.make_server('127.0.0.1', 0)
+    else:
+        httpd = server.socketserver.TCPServer(('127.0.0.1', 0), server.WomensHealthHandler)
+    print(json.dumps({'ready': True, 'port': httpd.server_address[1], 'startup_s': round(startup, 3),
+                      'rss_mb': peak_rss_mb(), 'result_cache': has_result_cache}), flush=True)
+    try:
+        httpd.serve_forever()
+    finally:
+        httpd.server_close()
+    print(json.dumps({'done': True, 'peak_rss_mb': peak_rss_mb()}), flush=True)
+
+def read_child_message(proc, key):
+    """Next JSON line from the child containing `key` (other prints are skipped)."""
+    for line in proc.stdout:
+        try:
+            message = json.loads(line)
+        except ValueError:
+            continue
+        if isinstance(message, dict) and key in message:
+            return message
+    raise RuntimeError(f"Server exited before reporting '{key}' (exit code {proc.wait()})")
+
+def start_server(server_dir, db_path, result_cache='off'):
+    # The handler's per-request access lines go to stderr; keep them out of the report
+    with open(os.path.join(os.path.dirname(db_path), 'server_stderr.log'), 'a') as stderr:
+        proc = subprocess.Popen(
+            [sys.executable, os.path.abspath(__file__), '--serve', server_dir, db_path, result_cache],
+            stdout=subprocess.PIPE, stderr=stderr, text=True)
+    try:
+        return proc, read_child_message(proc, 'ready')
+    except Exception:
+        proc.kill()
+        raise
+
+def stop_server(proc, port):
+    try:
+        conn = http.client.HTTPConnection('127.0.0.1', port, timeout=30)
+        conn.request('GET', '/api/shutdown')
+        conn.getresponse().read()
+        conn.close()
+        return read_child_message(proc, 'done')
+    finally:
+        try:
+            proc.wait(timeout=30)
+        except subprocess.TimeoutExpired:
+            proc.kill()
+
+# ---------------------------------------------------------------------------
+# Load generation
+# ---------------------------------------------------------------------------
+
+def percentile(sorted_values, pct):
+    if not sorted_values:
+        return None
+    rank = max(int(round(pct / 100.0 * len(sorted_values) + 0.5)) - 1, 0)
+    return sorted_values[min(rank, len(sorted_values) - 1)]
+
+def run_scenario(port, requests, concurrency):
+    """Send the requests over `concurrency` connections; return latency stats.
+
+    Connections are reused when the server allows keep-alive.
+    """
+    latencies = []
+    errors = []
+    received = [0]
+    next_index = [0]
+    lock = threading.Lock()
+
+    def worker():
+        conn = http.client.HTTPConnection('127.0.0.1', port, timeout=300)
+        while True:
+            with lock:
+                if next_index[0] >= len(requests):
+                    break
+                method, path, body, headers = requests[next_index[0]]
+                next_index[0] += 1
+            start = time.perf_counter()
+            try:
+                conn.request(method, path, body=body, headers=headers)
+                response = conn.getresponse()
+                data = response.read()
+                elapsed = time.perf_counter() - start
+                with lock:
+                    latencies.append(elapsed)
+                    received[0] += len(data)
+                    if response.status >= 400:
+                        errors.append(f"{response.status} {path}")
+            except (OSError, http.client.HTTPException) as e:
+                conn.close()
+                conn = http.client.HTTPConnection('127.0.0.1', port, timeout=300)
+                with lock:
+                    errors.append(f"{type(e).__name__} {path}")
+        conn.close()
+
+    threads = [threading.Thread(target=worker) for _ in range(max(1, min(concurrency, len(requests))))]
+    start = time.perf_counter()
+    for t in threads:
+        t.start()
+    for t in threads:
+        t.join()
+    wall = time.perf_counter() - start
+
+    latencies.sort()
+    to_ms = lambda v: None if v is None else round(v * 1000, 2)
+    return {
+        'requests': len(requests),
+        'errors': len(errors),
+        'first_errors': errors[:3],
+        'p50_ms': to_ms(percentile(latencies, 50)),
+        'p95_ms': to_ms(percentile(latencies, 95)),
+        'p99_ms': to_ms(percentile(latencies, 99)),
+        'max_ms': to_ms(latencies[-1] if latencies else None),
+        'throughput_rps': round(len(latencies) / wall, 1) if wall else None,
+        'mb_received': round(received[0] / (1024 * 1024), 2),
+    }
+
+def encode_cursor(session_date, row_id):
+    """Same token format as server.encode_cursor."""
+    raw = json.dumps([session_date, row_id]).encode('utf-8')
+    return base64.urlsafe_b64encode(raw).decode('ascii').rstrip('=')
+
+def search_terms(rng, vocab, count):
+    """Word prefixes a user might type, taken from the option vocabularies."""
+    words = sorted({w.strip('()/,-').lower() for field in ('presenting_issues', 'service_provided', 'country', 'language')
+                    for group in vocab.get(field, []) for value in group for w in value.split()})
+    words = [w for w in words if len(w) >= 5 and w.isalpha()]
+    return [w[:rng.randint(3, 5)] for w in rng.sample(words, min(count, len(words)))]
+
+def get(path, **headers):
+    return ('GET', path, None, headers)
+
+def build_scenarios(db_path, size, vocab, args):
+    """Scenario name -> list of requests, identical for every run of a seed."""
+    rng = random.Random(args.seed)
+    q = lambda params: '/api/records?' + urllib.parse.urlencode(params)
+    last_page = max(size // PER_PAGE, 1)
+    deep_pages = [max(1, int(last_page * rng.uniform(0.8, 1.0))) for _ in range(args.requests)]
+
+    conn = sqlite3.connect(db_path)
+    try:
+        keys = [conn.execute("SELECT session_date, id FROM submissions ORDER BY session_date DESC, id DESC "
+                             "LIMIT 1 OFFSET ?", ((page - 1) * PER_PAGE - 1,)).fetchone()
+                for page in deep_pages[:20]]
+        year = conn.execute("SELECT substr(max(session_date), 1, 4) FROM submissions").fetchone()[0]
+    finally:
+        conn.close()
+    cursors = [encode_cursor(*k) for k in keys if k]
+    terms = search_terms(rng, vocab, 20)
+    contact_modes = [v for g in vocab.get('contact_mode', [[]]) for v in g]
+    issues = [v for g in vocab.get('presenting_issues', [[]]) for v in g]
+    generator = RecordGenerator(vocab, args.seed + 1)
+
+    scenarios = {
+        'records_first_page': [get(q({'page': 1, 'per_page': PER_PAGE}))] * args.requests,
+        'records_deep_offset': [get(q({'page': p, 'per_page': PER_PAGE})) for p in deep_pages],
+        'records_deep_keyset': [get(q({'page': 2, 'per_page': PER_PAGE, 'after': cursors[i % len(cursors)]}))
+                                for i in range(args.requests)] if cursors else [],
+        'records_filtered': [get(q({'date_from': f"{year}-01-01", 'date_to': f"{year}-12-31",
+                                    'contact_mode': rng.choice(contact_modes), 'per_page': PER_PAGE}))
+                             for _ in range(args.requests)],
+        'records_multi_select': [get(q({'presenting_issues': '|'.join(rng.sample(issues, 2)), 'per_page': PER_PAGE}))
+                                 for _ in range(args.requests)],
+        'records_search': [get(q({'search': terms[i % len(terms)], 'per_page': PER_PAGE}))
+                           for i in range(args.requests)],
+        'records_search_deep': [get(q({'search': terms[i % len(terms)], 'page': 5, 'per_page': PER_PAGE}))
+                                for i in range(args.requests)],
+        'export_csv': [get('/api/export')] * args.export_requests,
+        'export_csv_gzip': [get('/api/export', **{'Accept-Encoding': 'gzip'})] * args.export_requests,
+        # Writes last so every read scenario sees the generated data unchanged
+        'submit': [('POST', '/api/submit', json.dumps(generator.generate_record(max(size // 4, 1))),
+                    {'Content-Type': 'application/json'}) for _ in range(args.requests)],
+    }
+    return {name: reqs for name, reqs in scenarios.items() if reqs and (not args.only or name in args.only)}
+
+def fresh_copy(base_path, db_path):
+    shutil.copyfile(base_path, db_path)
+    for suffix in ('-wal', '-shm'):
+        if os.path.exists(db_path + suffix):
+            os.remove(db_path + suffix)
+
+def run_pass(args, db_path, scenarios, result_cache):
+    """Run the scenarios against one server; (ready message, scenario stats, done message)."""
+    proc, ready = start_server(args.server_dir, db_path, result_cache)
+    stats_by_name = {}
+    try:
+        for name, requests in scenarios.items():
+            if args.warmup:
+                run_scenario(ready['port'], requests[:args.warmup], 1)
+            concurrency = 1 if name.startswith('export') else args.concurrency
+            stats = run_scenario(ready['port'], requests, concurrency)
+            stats_by_name[name] = stats
+            print(f"  {name:<22} p50 {stats['p50_ms']:>9} ms  p95 {stats['p95_ms']:>9} ms  "
+                  f"p99 {stats['p99_ms']:>9} ms  {stats['throughput_rps']:>8} req/s  errors {stats['errors']}",
+                  flush=True)
+    finally:
+        done = stop_server(proc, ready['port'])
+    return ready, stats_by_name, done
+
+def run_size(size, vocab, args, work_dir):
+    """Every scenario with the result cache off, then the reads again with it on.
+
+    Warm-up and repeated URLs make most cached requests hits, so the two
+    sets of numbers are reported apart: 'scenarios' is the work the server
+    does per request, 'cached_scenarios' what repeat visitors see.
+    """
+    base_path, build_s = cached_database(args.data_dir, size, vocab, args.seed)
+    db_path = os.path.join(work_dir, f"bench_{size}.db")
+    fresh_copy(base_path, db_path)
+    scenarios = build_scenarios(db_path, size, vocab, args)
+
+    print("  result cache off:", flush=True)
+    ready, uncached, done = run_pass(args, db_path, scenarios, 'off')
+    result = {'size': size, 'build_s': round(build_s, 2), 'server_start_s': ready['startup_s'],
+              'db_mb': round(os.path.getsize(db_path) / (1024 * 1024), 1), 'scenarios': uncached,
+              'cached_scenarios': {}, 'peak_rss_mb': done.get('peak_rss_mb')}
+
+    reads = {name: reqs for name, reqs in scenarios.items() if reqs[0][0] == 'GET'}
+    if reads and not args.no_cached and ready.get('result_cache'):
+        # A fresh copy: the submit scenario above added rows
+        fresh_copy(base_path, db_path)
+        print("  result cache on:", flush=True)
+        _, result['cached_scenarios'], done = run_pass(args, db_path, reads, 'on')
+        result['cached_peak_rss_mb'] = done.get('peak_rss_mb')
+    print(f"  server start {result['server_start_s']} s, peak RSS {result['peak_rss_mb']} MB", flush=True)
+    return result
+
+def git_revision():
+    try:
+        commit = subprocess.run(['git', 'rev-parse', '--short', 'HEAD'], cwd=APP_DIR,
+                                capture_output=True, text=True, check=True).stdout.strip()
+        dirty = subprocess.run(['git', 'status', '--porcelain', '--untracked-files=no'], cwd=APP_DIR,
+                               capture_output=True, text=True, check=True).stdout.strip() != ''
+        return commit, dirty
+    except (OSError, subprocess.CalledProcessError):
+        return None, None
+
+def compare_with_baseline(report, baseline_path, threshold):
+    """Print p50/p95 changes against an earlier report; True if any p95 regressed."""
+    with open(baseline_path, 'r', encoding='utf-8') as f:
+        baseline = json.load(f)
+    old_runs = {run['size']: run for run in baseline.get('runs', [])}
+    print(f"\nCompared with {baseline.get('commit')} ({baseline_path}), p95 threshold {threshold}%:")
+    regressed = False
+    for run in report['runs']:
+        old = old_runs.get(run['size'])
+        if not old:
+            continue
+        for section, label in (('scenarios', ''), ('cached_scenarios', ' (cached)')):
+            for name, stats in run.get(section, {}).items():
+                before = old.get(section, {}).get(name)
+                if not before or not before.get('p95_ms') or stats.get('p95_ms') is None:
+                    continue
+                change = (stats['p95_ms'] - before['p95_ms']) / before['p95_ms'] * 100
+                flag = ''
+                if change > threshold:
+                    flag = '  REGRESSION'
+                    regressed = True
+                print(f"  {run['size']:>8} {name + label:<31} p50 {before['p50_ms']} -> {stats['p50_ms']} ms  "
+                      f"p95 {before['p95_ms']} -> {stats['p95_ms']} ms ({change:+.0f}%){flag}")
+    return regressed
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark server.py against generated data.")
+    parser.add_argument('--sizes', default=DEFAULT_SIZES, help="comma-separated row counts (default %(default)s)")
+    parser.add_argument('--requests', type=int, default=200, help="requests per scenario")
+    parser.add_argument('--export-requests', type=int, default=3, help="requests per export scenario")
+    parser.add_argument('--concurrency', type=int, default=4, help="parallel connections")
+    parser.add_argument('--warmup', type=int, default=5, help="untimed requests before each scenario")
+    parser.add_argument('--seed', type=int, default=1)
+    parser.add_argument('--only', nargs='*', help="run just these scenarios")
+    parser.add_argument('--no-cached', action='store_true', help="skip the second pass with the result cache on")
+    parser.add_argument('--data-dir', default=DEFAULT_DATA_DIR, help="where generated databases are cached")
+    parser.add_argument('--server-dir', default=APP_DIR, help="directory holding the server.py to test")
+    parser.add_argument('--output', help="write the JSON report here")
+    parser.add_argument('--baseline', help="earlier JSON report to compare against")
+    parser.add_argument('--threshold', type=float, default=20.0, help="p95 increase (%%) counted as a regression")
+    args = parser.parse_args()
+
+    vocab = load_vocabularies()
+    commit, dirty = git_revision()
+    report = {
+        'commit': commit, 'dirty': dirty, 'timestamp': datetime.now().isoformat(timespec='seconds'),
+        'python': platform.python_version(), 'sqlite': sqlite3.sqlite_version, 'platform': platform.platform(),
+        'seed': args.seed, 'requests': args.requests, 'concurrency': args.concurrency, 'runs': [],
+    }
+    work_dir = tempfile.mkdtemp(prefix='womenshealth-bench-run-')
+    try:
+        for size in (int(s) for s in args.sizes.split(',') if s.strip()):
+            print(f"{size} submissions:", flush=True)
+            report['runs'].append(run_size(size, vocab, args, work_dir))
+    finally:
+        shutil.rmtree(work_dir, ignore_errors=True)
+
+    if args.output:
+        with open(args.output, 'w', encoding='utf-8') as f:
+            json.dump(report, f, indent=2)
+        print(f"\nReport written to {args.output}")
+    if args.baseline and compare_with_baseline(report, args.baseline, args.threshold):
+        sys.exit(1)
+
+if __name__ == "__main__":
+    if len(sys.argv) == 5 and sys.argv[1] == '--serve':
+        serve_child(sys.argv[2], sys.argv[3], sys.argv[4])
+    else:
+        main()
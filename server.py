@@ -11,6 +11,28 @@ from datetime import datetime
 import logging
 import getpass
 import socket
+import threading
+import queue
+import base64
+import bisect
+import re
+import select
+import zlib
+import calendar
+import gzip
+import hashlib
+import unicodedata
+import tempfile
+import time
+import pathlib
+from array import array
+from collections import OrderedDict
+from contextlib import contextmanager
+
+try:
+    import brotli  # Optional: enables br-encoded static files
+except ImportError:
+    brotli = None
 
 # Configuration
 APP_DIR = os.path.dirname(os.path.abspath(__file__))
@@ -18,10 +40,44 @@ DB_PATH = os.path.join(APP_DIR, 'womenshealth.db')
 LOG_PATH = os.path.join(APP_DIR, 'server.log')
 HTML_FORM_PATH = os.path.join(APP_DIR, 'WomensHealth_DataForm.html')
 HTML_VIEWER_PATH = os.path.join(APP_DIR, 'WomensHealth_Viewer.html')
+DATA_JSON_PATH = os.path.join(APP_DIR, 'data.json')
 LOCK_FILE = os.path.join(APP_DIR, 'server.lock')
 LOCK_INFO = os.path.join(APP_DIR, 'server.info')
+ARCHIVE_DIR = os.path.join(APP_DIR, 'archive')
 HOST = '127.0.0.1'
 PORT = 8080
+WORKER_THREADS = 8          # 0 = serve one request at a time
+REQUEST_QUEUE_SIZE = 32     # Connections waiting for a free worker before we answer 503
+DB_BUSY_TIMEOUT_MS = 5000
+COUNT_CACHE_SIZE = 128      # Distinct filters whose COUNT(*) we remember between writes
+RESULT_CACHE_ENTRIES = 256  # Finished /api/records and /api/export responses kept between writes (0 = off)
+RESULT_CACHE_BYTES = 32 * 1024 * 1024  # ...and the most body bytes they may hold; one entry gets at most a quarter
+EXPORT_BATCH_SIZE = 500     # Rows fetched and written per chunk when streaming CSV
+SUBMIT_BATCH_LIMIT = 5000   # Most submissions accepted by one /api/submit/batch call
+BACKUP_INTERVAL_MINUTES = 60    # Online backup while running (0 = only at shutdown)
+BACKUP_KEEP_PERIODIC = 24       # Periodic copies kept, separate from the 5 shutdown copies
+ARCHIVE_KEEP_YEARS = 2          # --archive keeps this many calendar years (this one included) in womenshealth.db
+ARCHIVE_ATTACH_LIMIT = 9        # Archive years one query may reach (SQLite attaches at most 10 databases)
+BACKUP_PAGES_PER_STEP = 256     # Pages copied per backup step before yielding
+BACKUP_STEP_SLEEP = 0.005       # Seconds to pause between backup steps
+RESTORE_CHUNK_SIZE = 64 * 1024  # Upload bytes read per step when restoring
+IMPORT_BATCH_SIZE = 1000    # CSV rows saved per transaction by /api/import
+IMPORT_ERROR_LIMIT = 1000   # Rejected rows listed in the import report; any beyond are only counted
+STATIC_CACHE_CONTROL = 'no-cache'  # Browsers keep the pages but revalidate (cheap 304) each load
+KEEPALIVE_TIMEOUT = 15      # Seconds an idle HTTP/1.1 connection may keep its worker (0 = close after each response)
+JSON_GZIP_MIN_BYTES = 2048  # Gzip JSON responses at least this big when the client accepts it
+JSON_GZIP_LEVEL = 5
+RECORDS_PAGE_MAX = 1000     # Largest per_page /api/records accepts
+OPTION_SEARCH_LIMIT = 20    # Default matches from /api/options/<field>/search (at most 100)
+OPTION_USAGE_REFRESH_SECONDS = 60  # Most-used ranking is recounted at most this often while records change
+CLIENT_HISTORY_LIMIT = 100  # Most recent sessions listed by /api/clients/<id>/history
+CHANGE_LOG_KEEP = 10000     # Most recent row events kept for /api/changes; older clients are told to reload
+CHANGES_PAGE_LIMIT = 500    # Most events returned by one /api/changes call
+CHANGES_MAX_WAIT = 25       # Longest /api/changes?wait= long-poll, in seconds
+CHANGES_MAX_WAITERS = 4     # Long-polls that may hold a worker at once; any more answer immediately
+SLOW_QUERY_MS = 250         # SQL slower than this is logged with its WHERE clause (0 = off)
+COLUMNAR_CACHE = True       # Answer /api/records filters from an in-memory column copy (False = SQL only)
+METRICS_BUCKETS = (0.001, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10)  # Seconds
 
 # Logging Setup
 logging.basicConfig(
@@ -69,72 +125,940 @@ def acquire_app_lock():
         return True
 
 def get_db_connection():
-    conn = sqlite3.connect(DB_PATH)
+    # uri=True only so archives can be ATTACHed with ?mode=ro; DB_PATH is still a plain path
+    conn = sqlite3.connect(DB_PATH, timeout=DB_BUSY_TIMEOUT_MS / 1000, uri=True)
     conn.row_factory = sqlite3.Row
-    # Enable WAL mode for reliability
-    conn.execute('PRAGMA journal_mode=WAL')
     return conn
 
+# Each worker thread keeps one long-lived connection. Bumping the epoch (e.g.
+# after a restore) makes every thread reopen its connection on next use.
+_thread_state = threading.local()
+_connection_epoch = 0
+
+# All writes funnel through this lock so only one connection ever holds the
+# WAL write lock; readers keep working against their own snapshot meanwhile.
+_write_lock = threading.RLock()
+
+# Incremented after every committed write; anything cached from a read is
+# only valid while the generation it was computed under is still current.
+_write_generation = 0
+
+# Newest change_log seq known to be committed, published after each write so
+# /api/records ETags and /api/changes long-polls never query for it.
+_change_seq = 0
+_change_cond = threading.Condition()
+_change_waiters = 0
+_change_closing = False
+
+def get_thread_connection():
+    conn = getattr(_thread_state, 'conn', None)
+    if conn is not None and _thread_state.epoch != _connection_epoch:
+        conn.close()
+        conn = None
+    if conn is None:
+        conn = get_db_connection()
+        _thread_state.conn = conn
+        _thread_state.epoch = _connection_epoch
+    return conn
+
+def close_thread_connection():
+    conn = getattr(_thread_state, 'conn', None)
+    if conn is not None:
+        conn.close()
+        _thread_state.conn = None
+
+def reset_connections():
+    """Force every worker to reopen its connection (call with _write_lock held)."""
+    global _connection_epoch
+    _connection_epoch += 1
+    close_thread_connection()
+    bump_write_generation()
+
+def bump_write_generation():
+    global _write_generation
+    with _write_lock:
+        _write_generation += 1
+
+@contextmanager
+def write_transaction():
+    """Serialized write path: yields this thread's connection inside BEGIN IMMEDIATE."""
+    with _write_lock:
+        conn = get_thread_connection()
+        conn.execute('BEGIN IMMEDIATE')
+        try:
+            yield conn
+            seq = trim_change_log(conn)
+            conn.commit()
+        except Exception:
+            conn.rollback()
+            COLUMN_CACHE.discard_staged()
+            bump_write_generation()
+            raise
+        # Readers only ever see committed rows in the columnar cache
+        COLUMN_CACHE.apply_staged(conn)
+        bump_write_generation()
+        publish_change_seq(seq)
+
+# /api/changes: events after a seq, oldest first, one page (+1 to tell if there are more)
+CHANGES_QUERY = "SELECT seq, op, submission_id FROM change_log WHERE seq > ? ORDER BY seq LIMIT ?"
+
+def latest_change_seq(conn):
+    row = conn.execute("SELECT seq FROM sqlite_sequence WHERE name = 'change_log'").fetchone()
+    return row[0] if row else 0
+
+def trim_change_log(conn):
+    """Drop all but the newest CHANGE_LOG_KEEP events; returns the newest seq."""
+    seq = latest_change_seq(conn)
+    conn.execute("DELETE FROM change_log WHERE seq <= ?", (seq - CHANGE_LOG_KEEP,))
+    return seq
+
+def log_change_reset(conn, floor=0):
+    """Replace the change log with one 'reset' event: every client must reload.
+
+    Used when rows change wholesale (restore, archive). The event's seq is
+    kept above `floor`, the newest seq handed out before a restore, so
+    sequence numbers never go backwards.
+    """
+    conn.execute("DELETE FROM change_log")
+    conn.execute(
+        "INSERT INTO change_log (seq, op) VALUES"
+        " (max(coalesce((SELECT seq FROM sqlite_sequence WHERE name = 'change_log'), 0), ?) + 1, 'reset')",
+        (floor,))
+
+def publish_change_seq(seq):
+    global _change_seq
+    with _change_cond:
+        if seq != _change_seq:
+            _change_seq = seq
+            _change_cond.notify_all()
+
+def wait_for_change(since, timeout):
+    """Block until the published seq moves past `since`, `timeout` passes or the server stops.
+
+    Returns at once when CHANGES_MAX_WAITERS long-polls are already parked
+    (or there is no worker pool), so waiting clients never hold every worker.
+    """
+    global _change_waiters
+    with _change_cond:
+        if WORKER_THREADS == 0 or _change_waiters >= CHANGES_MAX_WAITERS:
+            return
+        _change_waiters += 1
+        try:
+            _change_cond.wait_for(lambda: _change_seq != since or _change_closing, timeout)
+        finally:
+            _change_waiters -= 1
+
+def release_change_waiters():
+    """Answer every parked long-poll now (shutdown)."""
+    global _change_closing
+    with _change_cond:
+        _change_closing = True
+        _change_cond.notify_all()
+
+# Sessions older than the --archive cutoff live in archive/womenshealth_<year>.db,
+# one read-only file per year. Queries attach the years their date range
+# reaches to the thread's connection as archive_<year> and UNION ALL them
+# with main; without a date_from only the live file is searched.
+
+def archive_path(year):
+    return os.path.join(ARCHIVE_DIR, f'womenshealth_{year}.db')
+
+def archive_years():
+    """Years that have an archive file, oldest first."""
+    try:
+        names = os.listdir(ARCHIVE_DIR)
+    except OSError:
+        return []
+    return sorted(int(m.group(1)) for m in (re.fullmatch(r'womenshealth_(\d{4})\.db', name) for name in names) if m)
+
+def archive_years_for(date_from, date_to):
+    """Archive years a date range reaches (none unless date_from is given)."""
+    if not date_from or not date_from[:4].isdigit():
+        return []
+    last = int(date_to[:4]) if date_to and date_to[:4].isdigit() else 9999
+    return [year for year in archive_years() if int(date_from[:4]) <= year <= last]
+
+def attach_archives(conn, years):
+    """Attach these archive years read-only to conn; returns their schema names, newest first.
+
+    Years attached for earlier queries stay attached until room is needed.
+    """
+    wanted = [f"archive_{year}" for year in sorted(years, reverse=True)]
+    if len(wanted) > ARCHIVE_ATTACH_LIMIT:
+        raise ValueError(f"At most {ARCHIVE_ATTACH_LIMIT} archived years can be searched at once")
+    attached = [row[1] for row in conn.execute("PRAGMA database_list") if row[1] not in ('main', 'temp')]
+    spare = [name for name in attached if name not in wanted]
+    while spare and len(attached) + len([w for w in wanted if w not in attached]) > ARCHIVE_ATTACH_LIMIT:
+        name = spare.pop()
+        conn.execute(f"DETACH DATABASE {name}")
+        attached.remove(name)
+    for name, year in zip(wanted, sorted(years, reverse=True)):
+        if name not in attached:
+            uri = pathlib.Path(archive_path(year)).as_uri() + '?mode=ro'
+            conn.execute(f"ATTACH DATABASE ? AS {name}", (uri,))
+    return wanted
+
+def attached_archive_chunks(conn, years):
+    """attach_archives() for any number of years, ARCHIVE_ATTACH_LIMIT at a time."""
+    for i in range(0, len(years), ARCHIVE_ATTACH_LIMIT):
+        yield attach_archives(conn, years[i:i + ARCHIVE_ATTACH_LIMIT])
+
+def archived_year_of(conn, row_id):
+    """The archive year holding submission `row_id`, or None."""
+    for schemas in attached_archive_chunks(conn, archive_years()):
+        for schema in schemas:
+            if conn.execute(f"SELECT 1 FROM {schema}.submissions WHERE id = ?", (row_id,)).fetchone():
+                return int(schema[len('archive_'):])
+    return None
+
+class Metrics:
+    """Process-wide counters, gauges and latency histograms for /api/metrics.
+
+    Series are keyed by metric name plus a tuple of (label, value) pairs and
+    rendered in the Prometheus text exposition format.
+    """
+
+    def __init__(self, buckets=METRICS_BUCKETS):
+        self.buckets = buckets
+        self._lock = threading.Lock()
+        self._meta = {}         # name -> (type, help)
+        self._values = {}       # (name, labels) -> float
+        self._histograms = {}   # (name, labels) -> [bucket counts..., sum, count]
+
+    def describe(self, name, kind, help_text):
+        self._meta[name] = (kind, help_text)
+
+    def inc(self, name, labels=(), amount=1):
+        with self._lock:
+            self._values[(name, labels)] = self._values.get((name, labels), 0) + amount
+
+    def set(self, name, value, labels=()):
+        with self._lock:
+            self._values[(name, labels)] = value
+
+    def observe(self, name, value, labels=()):
+        with self._lock:
+            series = self._histograms.get((name, labels))
+            if series is None:
+                series = self._histograms[(name, labels)] = [0] * (len(self.buckets) + 2)
+            for i, bound in enumerate(self.buckets):
+                if value <= bound:
+                    series[i] += 1
+            series[-2] += value
+            series[-1] += 1
+
+    def render(self):
+        with self._lock:
+            values = sorted(self._values.items())
+            histograms = sorted((k, list(v)) for k, v in self._histograms.items())
+        by_name = {}
+        for (name, labels), value in values:
+            by_name.setdefault(name, []).append(f"{name}{format_labels(labels)} {value}")
+        for (name, labels), series in histograms:
+            lines = by_name.setdefault(name, [])
+            for bound, count in zip(self.buckets, series):
+                lines.append(f"{name}_bucket{format_labels(labels + (('le', f'{bound:g}'),))} {count}")
+            lines.append(f"{name}_bucket{format_labels(labels + (('le', '+Inf'),))} {series[-1]}")
+            lines.append(f"{name}_sum{format_labels(labels)} {series[-2]:.6f}")
+            lines.append(f"{name}_count{format_labels(labels)} {series[-1]}")
+        out = []
+        for name, lines in by_name.items():
+            kind, help_text = self._meta.get(name, ('untyped', ''))
+            out.append(f"# HELP {name} {help_text}")
+            out.append(f"# TYPE {name} {kind}")
+            out.extend(lines)
+        return "\n".join(out) + "\n"
+
+def format_labels(labels):
+    if not labels:
+        return ""
+    escape = lambda v: str(v).replace('\\', '\\\\').replace('"', '\\"').replace('\n', '\\n')
+    return "{" + ",".join(f'{k}="{escape(v)}"' for k, v in labels) + "}"
+
+METRICS = Metrics()
+METRICS.describe('womenshealth_http_requests_total', 'counter', 'HTTP requests handled, by route and status.')
+METRICS.describe('womenshealth_http_request_duration_seconds', 'histogram', 'Time to handle a request, by route.')
+METRICS.describe('womenshealth_http_response_bytes_total', 'counter', 'Response bytes written (headers included), by route.')
+METRICS.describe('womenshealth_sql_query_duration_seconds', 'histogram', 'Time spent in SQLite per statement, by query.')
+METRICS.describe('womenshealth_sql_rows_total', 'counter', 'Rows returned by SQLite, by query.')
+METRICS.describe('womenshealth_sql_slow_queries_total', 'counter', 'Statements slower than SLOW_QUERY_MS, by query.')
+METRICS.describe('womenshealth_count_cache_total', 'counter', 'Filtered COUNT(*) lookups, by result (hit or miss).')
+METRICS.describe('womenshealth_columnar_cache_total', 'counter', 'Record filters answered from the columnar cache (hit) or SQLite (fallback).')
+METRICS.describe('womenshealth_columnar_filter_duration_seconds', 'histogram', 'Time to evaluate a filter against the columnar cache.')
+METRICS.describe('womenshealth_columnar_cache_rows', 'gauge', 'Rows held in the columnar cache.')
+METRICS.describe('womenshealth_result_cache_total', 'counter', 'Record/export responses served from the result cache (hit) or built (miss), by route.')
+METRICS.describe('womenshealth_result_cache_entries', 'gauge', 'Responses held in the result cache.')
+METRICS.describe('womenshealth_result_cache_bytes', 'gauge', 'Body bytes held in the result cache.')
+METRICS.describe('womenshealth_write_generation', 'gauge', 'Committed writes since startup.')
+METRICS.describe('womenshealth_change_seq', 'gauge', 'Newest change_log sequence number (the /api/records ETag).')
+METRICS.describe('womenshealth_change_waiters', 'gauge', 'Long-polls parked on /api/changes.')
+METRICS.describe('womenshealth_start_time_seconds', 'gauge', 'Unix time the server process started.')
+METRICS.set('womenshealth_start_time_seconds', int(time.time()))
+
+def record_query(name, seconds, rows, where_str='', param_count=0):
+    """Account one SQL statement and log it if it is slower than SLOW_QUERY_MS.
+
+    Only the WHERE clause and the number of bound parameters are logged,
+    never the values, which can be client details.
+    """
+    labels = (('query', name),)
+    METRICS.observe('womenshealth_sql_query_duration_seconds', seconds, labels)
+    METRICS.inc('womenshealth_sql_rows_total', labels, rows)
+    if SLOW_QUERY_MS and seconds * 1000 >= SLOW_QUERY_MS:
+        METRICS.inc('womenshealth_sql_slow_queries_total', labels)
+        logging.warning(f"Slow query '{name}': {seconds * 1000:.0f} ms, {rows} rows, "
+                        f"WHERE{where_str[len(' WHERE'):] if where_str else ' (none)'} [{param_count} params]")
+
+def route_label(method, path):
+    """Bounded route name for metrics: known paths as-is, ids collapsed."""
+    path = urllib.parse.urlparse(path).path
+    if path in KNOWN_ROUTES:
+        return path
+    if method == 'DELETE' and re.fullmatch(r'/api/record/[^/]+', path):
+        return '/api/record/<id>'
+    if path.startswith('/api/clients/') and path.endswith('/history'):
+        return '/api/clients/<id>/history'
+    if path.startswith('/api/options/'):
+        return '/api/options/<field>/search' if path.endswith('/search') else '/api/options/<field>'
+    return 'other'
+
+# Filtered totals keyed by (where clause, params). Each entry remembers the
+# write generation it was counted under, so paging through one filter only
+# pays for COUNT(*) once between writes.
+_count_cache = {}
+_count_cache_lock = threading.Lock()
+
+def cached_count(conn, where_str, query_params, table='submissions'):
+    key = (table, where_str, tuple(query_params))
+    generation = _write_generation
+    with _count_cache_lock:
+        hit = _count_cache.get(key)
+        if hit is not None and hit[0] == generation:
+            METRICS.inc('womenshealth_count_cache_total', (('result', 'hit'),))
+            return hit[1]
+
+    METRICS.inc('womenshealth_count_cache_total', (('result', 'miss'),))
+    start = time.perf_counter()
+    total = conn.execute(count_query(where_str, table), query_params).fetchone()['total']
+    record_query('count', time.perf_counter() - start, 1, where_str, len(query_params))
+
+    with _count_cache_lock:
+        if len(_count_cache) >= COUNT_CACHE_SIZE:
+            _count_cache.clear()
+        _count_cache[key] = (generation, total)
+    return total
+
+def count_query(where_str, table='submissions'):
+    return f"SELECT COUNT(*) AS total FROM {table}{where_str}"
+
+def like_prefix(value):
+    """LIKE pattern (ESCAPE '\\') matching values that start with `value`."""
+    return value.replace('\\', '\\\\').replace('%', '\\%').replace('_', '\\_') + '%'
+
+def encode_cursor(session_date, row_id):
+    """Opaque keyset token for the row a page ended on."""
+    raw = json.dumps([session_date, row_id]).encode('utf-8')
+    return base64.urlsafe_b64encode(raw).decode('ascii').rstrip('=')
+
+def decode_cursor(token):
+    """Inverse of encode_cursor; raises ValueError on anything malformed."""
+    try:
+        raw = base64.urlsafe_b64decode(token + '=' * (-len(token) % 4))
+        session_date, row_id = json.loads(raw)
+    except Exception:
+        raise ValueError("Invalid cursor")
+    if not isinstance(session_date, str) or not isinstance(row_id, int):
+        raise ValueError("Invalid cursor")
+    return session_date, row_id
+
+# Columns written by /api/submit, in INSERT order
+SUBMISSION_FIELDS = [
+    'session_date', 'client_id', 'staff_member', 'client_status', 'visit_number', 'age', 'carer', 'financial_hardship', 'social_isolation', 'rural_postcode', 'lgbtiq',
+    'funding_stream', 'funding_option', 'contact_mode',
+    'country', 'language', 'income_source', 'visa_type', 'ethnicity',
+    'disability', 'chronic_illness', 'presenting_issues', 'service_provided',
+    'service_type', 'practitioner', 'group_type', 'evaluation_tools'
+]
+
+# Multi-select fields: stored pipe-joined on submissions (that is what export
+# writes) and also one row per chosen option in submission_options for filtering.
+MULTI_SELECT_FIELDS = [
+    'ethnicity', 'visa_type', 'disability', 'chronic_illness', 'presenting_issues',
+    'service_provided', 'service_type', 'practitioner', 'group_type', 'evaluation_tools',
+]
+
+# /api/records filters other than date range, multi-select and search:
+# exact matches, case-insensitive prefixes and case-insensitive substrings.
+EXACT_FILTER_FIELDS = ['age', 'contact_mode', 'funding_stream']
+PREFIX_FILTER_FIELDS = ['client_id', 'staff_member']
+LIKE_FILTER_FIELDS = [
+    'client_status', 'visit_number', 'carer', 'financial_hardship', 'social_isolation', 'rural_postcode', 'lgbtiq', 'funding_option', 'country', 'language',
+    'income_source',
+]
+
+# Per-client details that carry over between visits; /api/clients/<id>/history
+# returns the most recent non-empty value of each for pre-filling the form.
+CLIENT_PROFILE_FIELDS = [
+    'age', 'carer', 'financial_hardship', 'social_isolation', 'rural_postcode', 'lgbtiq',
+    'country', 'language', 'income_source', 'visa_type', 'ethnicity', 'disability', 'chronic_illness',
+]
+
+# Columns of each session listed by /api/clients/<id>/history
+CLIENT_HISTORY_COLUMNS = ['id', 'session_date', 'visit_number', 'staff_member', 'contact_mode',
+                          'presenting_issues', 'service_type']
+
+# Columns copied into archive files, and selected when a query spans them
+ARCHIVE_COLUMNS = ['id', 'submitted_at'] + SUBMISSION_FIELDS
+
+INSERT_SUBMISSION_SQL = (
+    f"INSERT INTO submissions ({', '.join(SUBMISSION_FIELDS)}) "
+    f"VALUES ({', '.join(['?'] * len(SUBMISSION_FIELDS))})"
+)
+
+def split_options(stored):
+    """Split a pipe-joined multi-select value into its individual options."""
+    if not stored:
+        return []
+    return [v.strip() for v in str(stored).split('|') if v.strip()]
+
+def option_rows(row_id, record):
+    """submission_options rows for one record (a dict of field -> stored value)."""
+    return [(row_id, field, value) for field in MULTI_SELECT_FIELDS for value in split_options(record.get(field))]
+
+def prepare_submission(data):
+    """Validate one submitted record and return its SUBMISSION_FIELDS values.
+
+    Raises ValueError with a user-facing message if the record is rejected.
+    """
+    if not isinstance(data, dict):
+        raise ValueError("Submission must be a JSON object")
+
+    # Validation
+    session_date = data.get('session_date')
+    if not session_date:
+        raise ValueError("session_date is required")
+    if not isinstance(session_date, str):
+        raise ValueError("session_date must be text")
+
+    # Prepare fields (handling multi-select join with '|'). Anything that is
+    # not text, a number or a list of text is rejected here, so one bad
+    # record gets its own error rather than failing a whole batch at bind time.
+    values = []
+    for field in SUBMISSION_FIELDS:
+        val = data.get(field, "")
+        if isinstance(val, list):
+            if not all(isinstance(item, str) for item in val):
+                raise ValueError(f"{field}: every selected option must be text")
+            val = "|".join(val)
+        elif isinstance(val, (int, float)) and not isinstance(val, bool):
+            val = str(val)
+        elif val is not None and not isinstance(val, str):
+            raise ValueError(f"{field} must be text or a list of options")
+        values.append(val)
+    return values
+
+def insert_submission(conn, values):
+    """Insert one row of SUBMISSION_FIELDS values and index its multi-select options."""
+    cursor = conn.execute(INSERT_SUBMISSION_SQL, values)
+    row_id = cursor.lastrowid
+    conn.executemany(
+        "INSERT OR IGNORE INTO submission_options (submission_id, field, value) VALUES (?, ?, ?)",
+        option_rows(row_id, dict(zip(SUBMISSION_FIELDS, values))))
+    return row_id
+
+def insert_submissions(conn, rows):
+    """Bulk insert_submission, returns the new ids in order.
+
+    Must run inside write_transaction(). With AUTOINCREMENT and the write
+    lock held, the new ids are exactly the ones following sqlite_sequence.
+
+    Rows are staged in a temp table and copied with one INSERT ... SELECT:
+    FTS5 flushes its pending index data at the start of every statement, so
+    one INSERT per row would write one tiny index segment per row and get
+    slower the bigger the table is.
+    """
+    seq = conn.execute("SELECT seq FROM sqlite_sequence WHERE name = 'submissions'").fetchone()
+    first_id = (seq[0] if seq else 0) + 1
+    conn.execute(f"CREATE TEMP TABLE IF NOT EXISTS submission_staging ({', '.join(SUBMISSION_FIELDS)})")
+    conn.executemany(
+        f"INSERT INTO temp.submission_staging VALUES ({', '.join(['?'] * len(SUBMISSION_FIELDS))})", rows)
+    conn.execute(
+        f"INSERT INTO submissions ({', '.join(SUBMISSION_FIELDS)}) "
+        f"SELECT {', '.join(SUBMISSION_FIELDS)} FROM temp.submission_staging ORDER BY rowid")
+    conn.execute("DELETE FROM temp.submission_staging")
+    ids = list(range(first_id, first_id + len(rows)))
+    conn.executemany(
+        "INSERT OR IGNORE INTO submission_options (submission_id, field, value) VALUES (?, ?, ?)",
+        [opt for row_id, values in zip(ids, rows) for opt in option_rows(row_id, dict(zip(SUBMISSION_FIELDS, values)))])
+    return ids
+
+def import_vocabularies():
+    """{field: {lowercased option: option as written in data.json}} for every fixed-choice field.
+
+    data.json also feeds every dropdown and checkbox list on the form, so
+    imports accept exactly what the form offers.
+    """
+    fields = OPTION_INDEX.fields() or {}
+    return {field: {value.lower(): value for value, _, _ in entry.options}
+            for field, entry in fields.items() if field in SUBMISSION_FIELDS}
+
+def prepare_import_row(record, vocabularies):
+    """SUBMISSION_FIELDS values for one imported CSV row (a dict of column -> text).
+
+    Options are matched case-insensitively and saved as data.json spells
+    them. Raises ValueError with a user-facing message if the row is rejected.
+    """
+    values = []
+    for field in SUBMISSION_FIELDS:
+        val = (record.get(field) or '').strip()
+        vocabulary = vocabularies.get(field)
+        if val and vocabulary is not None:
+            chosen = []
+            for option in (split_options(val) if field in MULTI_SELECT_FIELDS else [val]):
+                canonical = vocabulary.get(option.lower())
+                if canonical is None:
+                    raise ValueError(f"{field}: '{option}' is not one of the form's options")
+                chosen.append(canonical)
+            val = '|'.join(chosen)
+        values.append(val)
+
+    session_date = values[SUBMISSION_FIELDS.index('session_date')]
+    if not session_date:
+        raise ValueError("session_date is required")
+    try:
+        datetime.strptime(session_date, '%Y-%m-%d')
+    except ValueError:
+        raise ValueError(f"session_date '{session_date}' is not a YYYY-MM-DD date")
+    return values
+
+def ensure_option_index(cursor):
+    """Create submission_options, backfilling it from existing rows the first time."""
+    cursor.execute("SELECT 1 FROM sqlite_master WHERE type = 'table' AND name = 'submission_options'")
+    existed = cursor.fetchone() is not None
+
+    cursor.execute('''
+        CREATE TABLE IF NOT EXISTS submission_options (
+            submission_id INTEGER NOT NULL,
+            field TEXT NOT NULL,
+            value TEXT NOT NULL COLLATE NOCASE,
+            PRIMARY KEY (field, value, submission_id)
+        ) WITHOUT ROWID
+    ''')
+    cursor.execute("CREATE INDEX IF NOT EXISTS idx_submission_options_submission ON submission_options(submission_id)")
+    cursor.execute('''
+        CREATE TRIGGER IF NOT EXISTS submission_options_ad AFTER DELETE ON submissions BEGIN
+            DELETE FROM submission_options WHERE submission_id = old.id;
+        END
+    ''')
+    if not existed:
+        cursor.execute(f"SELECT id, {', '.join(MULTI_SELECT_FIELDS)} FROM submissions")
+        for row in cursor.fetchall():
+            cursor.connection.executemany(
+                "INSERT OR IGNORE INTO submission_options (submission_id, field, value) VALUES (?, ?, ?)",
+                option_rows(row['id'], dict(row)))
+
+# Columns covered by the viewer's free-text search (and the FTS5 index behind it)
+SEARCH_FIELDS = [
+    'client_id', 'staff_member', 'client_status', 'visit_number',
+    'age', 'contact_mode', 'session_date',
+    'carer', 'financial_hardship', 'social_isolation', 'rural_postcode', 'lgbtiq',
+    'funding_stream', 'funding_option', 'country', 'language', 'ethnicity',
+    'disability', 'chronic_illness', 'presenting_issues', 'service_provided',
+    'service_type', 'practitioner', 'evaluation_tools', 'group_type',
+    'visa_type', 'income_source',
+]
+
+def ensure_search_index(cursor):
+    """Create the FTS5 table and the triggers that keep it in step with submissions."""
+    cursor.execute("SELECT 1 FROM sqlite_master WHERE type = 'table' AND name = 'submissions_fts'")
+    existed = cursor.fetchone() is not None
+
+    cols = ", ".join(SEARCH_FIELDS)
+    new_cols = ", ".join(f"new.{c}" for c in SEARCH_FIELDS)
+    old_cols = ", ".join(f"old.{c}" for c in SEARCH_FIELDS)
+    cursor.execute(f'''
+        CREATE VIRTUAL TABLE IF NOT EXISTS submissions_fts USING fts5(
+            {cols},
+            content='submissions', content_rowid='id',
+            tokenize='unicode61 remove_diacritics 2', prefix='2 3'
+        )
+    ''')
+    cursor.execute(f'''
+        CREATE TRIGGER IF NOT EXISTS submissions_fts_ai AFTER INSERT ON submissions BEGIN
+            INSERT INTO submissions_fts(rowid, {cols}) VALUES (new.id, {new_cols});
+        END
+    ''')
+    cursor.execute(f'''
+        CREATE TRIGGER IF NOT EXISTS submissions_fts_ad AFTER DELETE ON submissions BEGIN
+            INSERT INTO submissions_fts(submissions_fts, rowid, {cols}) VALUES ('delete', old.id, {old_cols});
+        END
+    ''')
+    cursor.execute(f'''
+        CREATE TRIGGER IF NOT EXISTS submissions_fts_au AFTER UPDATE ON submissions BEGIN
+            INSERT INTO submissions_fts(submissions_fts, rowid, {cols}) VALUES ('delete', old.id, {old_cols});
+            INSERT INTO submissions_fts(rowid, {cols}) VALUES (new.id, {new_cols});
+        END
+    ''')
+    if not existed:
+        rebuild_search_index(cursor)
+
+def rebuild_search_index(cursor):
+    cursor.execute("INSERT INTO submissions_fts(submissions_fts) VALUES ('rebuild')")
+
+def fts_match_expression(text):
+    """Turn free text into an FTS5 query: every word must match, as a prefix.
+
+    Each whitespace-separated word becomes a quoted phrase of its tokens with
+    a trailing '*', so 'anx C-001' finds 'Anxiety' and client 'C-00123'.
+    Returns None when the text contains nothing searchable.
+    """
+    terms = []
+    for word in text.split():
+        tokens = re.findall(r'\w+', word)
+        if tokens:
+            terms.append('"' + " ".join(tokens) + '"*')
+    return " AND ".join(terms) if terms else None
+
+# Dimensions rolled up per month in stats_monthly, plus an overall 'total'.
+# Multi-select dimensions count one session per chosen option.
+STATS_DIMENSIONS = [
+    'funding_stream', 'practitioner', 'service_type', 'contact_mode',
+    'carer', 'financial_hardship', 'social_isolation', 'rural_postcode', 'lgbtiq',
+]
+
+def ensure_stats_rollup(cursor):
+    """Create stats_monthly and the triggers that keep it current.
+
+    Single-valued dimensions are maintained from submissions directly.
+    Multi-select ones are added from submission_options (the options are
+    written after their submission row), and removed in a BEFORE DELETE
+    trigger while the options still exist.
+    """
+    cursor.execute("SELECT 1 FROM sqlite_master WHERE type = 'table' AND name = 'stats_monthly'")
+    existed = cursor.fetchone() is not None
+
+    cursor.execute('''
+        CREATE TABLE IF NOT EXISTS stats_monthly (
+            month TEXT NOT NULL,
+            dimension TEXT NOT NULL,
+            value TEXT NOT NULL,
+            sessions INTEGER NOT NULL,
+            PRIMARY KEY (month, dimension, value)
+        ) WITHOUT ROWID
+    ''')
+
+    single = [d for d in STATS_DIMENSIONS if d not in MULTI_SELECT_FIELDS]
+    multi = [d for d in STATS_DIMENSIONS if d in MULTI_SELECT_FIELDS]
+    multi_list = ", ".join(f"'{d}'" for d in multi)
+
+    def single_values(alias):
+        rows = [f"(substr({alias}.session_date, 1, 7), 'total', '')"]
+        rows += [f"(substr({alias}.session_date, 1, 7), '{d}', coalesce({alias}.{d}, ''))" for d in single]
+        return ", ".join(rows)
+
+    cursor.execute(f'''
+        CREATE TRIGGER IF NOT EXISTS stats_monthly_ai AFTER INSERT ON submissions BEGIN
+            INSERT INTO stats_monthly (month, dimension, value, sessions)
+            SELECT column1, column2, column3, 1 FROM (VALUES {single_values('new')}) WHERE true
+            ON CONFLICT (month, dimension, value) DO UPDATE SET sessions = sessions + 1;
+        END
+    ''')
+    cursor.execute(f'''
+        CREATE TRIGGER IF NOT EXISTS stats_monthly_bd BEFORE DELETE ON submissions BEGIN
+            UPDATE stats_monthly SET sessions = sessions - 1
+            WHERE (month, dimension, value) IN (VALUES {single_values('old')});
+            UPDATE stats_monthly SET sessions = sessions - 1
+            WHERE month = substr(old.session_date, 1, 7)
+              AND (dimension, value) IN (
+                  SELECT field, value FROM submission_options
+                  WHERE submission_id = old.id AND field IN ({multi_list}));
+            DELETE FROM stats_monthly WHERE month = substr(old.session_date, 1, 7) AND sessions <= 0;
+        END
+    ''')
+    cursor.execute(f'''
+        CREATE TRIGGER IF NOT EXISTS stats_monthly_options_ai AFTER INSERT ON submission_options
+        WHEN new.field IN ({multi_list}) BEGIN
+            INSERT INTO stats_monthly (month, dimension, value, sessions)
+            SELECT substr(session_date, 1, 7), new.field, new.value, 1 FROM submissions WHERE id = new.submission_id
+            ON CONFLICT (month, dimension, value) DO UPDATE SET sessions = sessions + 1;
+        END
+    ''')
+
+    if not existed:
+        cursor.execute("INSERT INTO stats_monthly SELECT substr(session_date, 1, 7), 'total', '', COUNT(*) FROM submissions GROUP BY 1")
+        for d in single:
+            cursor.execute(f"INSERT INTO stats_monthly SELECT substr(session_date, 1, 7), '{d}', coalesce({d}, ''), COUNT(*) FROM submissions GROUP BY 1, 3")
+        cursor.execute(f'''
+            INSERT INTO stats_monthly
+            SELECT substr(s.session_date, 1, 7), o.field, o.value, COUNT(*)
+            FROM submission_options o JOIN submissions s ON s.id = o.submission_id
+            WHERE o.field IN ({multi_list})
+            GROUP BY 1, 2, 3
+        ''')
+
+def ensure_change_log(cursor):
+    """Create change_log and the triggers that append an event per row change.
+
+    seq is AUTOINCREMENT so a number is never handed out twice, even after
+    the oldest events are trimmed; clients keep it between /api/changes calls.
+    """
+    cursor.execute('''
+        CREATE TABLE IF NOT EXISTS change_log (
+            seq INTEGER PRIMARY KEY AUTOINCREMENT,
+            op TEXT NOT NULL,
+            submission_id INTEGER
+        )
+    ''')
+    for suffix, event, op, row in (('ai', 'INSERT', 'insert', 'new'), ('au', 'UPDATE', 'update', 'new'),
+                                   ('ad', 'DELETE', 'delete', 'old')):
+        cursor.execute(f'''
+            CREATE TRIGGER IF NOT EXISTS change_log_{suffix} AFTER {event} ON submissions BEGIN
+                INSERT INTO change_log (op, submission_id) VALUES ('{op}', {row}.id);
+            END
+        ''')
+
+def month_aligned_range(date_from, date_to):
+    """(first_month, last_month) if the date filter covers whole months, else None.
+
+    Open ends are allowed; a range that cuts through a month cannot be
+    answered from the monthly rollup.
+    """
+    first = last = None
+    try:
+        if date_from:
+            start = datetime.strptime(date_from, '%Y-%m-%d')
+            if start.day != 1:
+                return None
+            first = start.strftime('%Y-%m')
+        if date_to:
+            end = datetime.strptime(date_to, '%Y-%m-%d')
+            if end.day != calendar.monthrange(end.year, end.month)[1]:
+                return None
+            last = end.strftime('%Y-%m')
+    except ValueError:
+        return None
+    return first, last
+
+def migrate_base_schema(cursor):
+    cursor.execute('''
+        CREATE TABLE IF NOT EXISTS submissions (
+            id INTEGER PRIMARY KEY AUTOINCREMENT,
+            submitted_at TEXT NOT NULL DEFAULT (datetime('now','localtime')),
+            session_date TEXT NOT NULL,
+            client_id TEXT,
+            age TEXT,
+            contact_mode TEXT,
+            country TEXT,
+            language TEXT,
+            income_source TEXT,
+            visa_type TEXT,
+            ethnicity TEXT,
+            disability TEXT,
+            chronic_illness TEXT,
+            presenting_issues TEXT,
+            service_provided TEXT,
+            service_type TEXT,
+            practitioner TEXT,
+            group_type TEXT,
+            evaluation_tools TEXT
+        )
+    ''')
+    
+    # Schema migration: Add staff_member if not exists
+    cursor.execute("PRAGMA table_info(submissions)")
+    columns = [row['name'] for row in cursor.fetchall()]
+    if 'staff_member' not in columns:
+        cursor.execute("ALTER TABLE submissions ADD COLUMN staff_member TEXT")
+    if 'client_status' not in columns:
+        cursor.execute("ALTER TABLE submissions ADD COLUMN client_status TEXT")
+    if 'visit_number' not in columns:
+        cursor.execute("ALTER TABLE submissions ADD COLUMN visit_number TEXT")
+    if 'carer' not in columns:
+        cursor.execute("ALTER TABLE submissions ADD COLUMN carer TEXT DEFAULT 'No'")
+    if 'financial_hardship' not in columns:
+        cursor.execute("ALTER TABLE submissions ADD COLUMN financial_hardship TEXT DEFAULT 'No'")
+    if 'social_isolation' not in columns:
+        cursor.execute("ALTER TABLE submissions ADD COLUMN social_isolation TEXT DEFAULT 'No'")
+    if 'rural_postcode' not in columns:
+        cursor.execute("ALTER TABLE submissions ADD COLUMN rural_postcode TEXT DEFAULT 'No'")
+    if 'lgbtiq' not in columns:
+        cursor.execute("ALTER TABLE submissions ADD COLUMN lgbtiq TEXT DEFAULT 'No'")
+    if 'funding_stream' not in columns:
+        cursor.execute("ALTER TABLE submissions ADD COLUMN funding_stream TEXT")
+    if 'funding_option' not in columns:
+        cursor.execute("ALTER TABLE submissions ADD COLUMN funding_option TEXT")
+
+def migrate_keyset_index(cursor):
+    # Matches the viewer's ORDER BY so keyset pages are a short index range scan
+    cursor.execute("CREATE INDEX IF NOT EXISTS idx_submissions_date_id ON submissions(session_date, id)")
+
+# Secondary indexes on submissions owned by the migrations. Changing this set
+# needs a new migration that calls sync_indexes() again.
+MANAGED_INDEXES = {
+    'idx_submissions_date_id': "submissions(session_date, id)",
+    'idx_submissions_client_id': "submissions(client_id COLLATE NOCASE, session_date)",
+    'idx_submissions_staff_member': "submissions(staff_member COLLATE NOCASE)",
+    'idx_submissions_contact_mode': "submissions(contact_mode)",
+    'idx_submissions_age': "submissions(age)",
+    'idx_submissions_funding_stream': "submissions(funding_stream)",
+}
+
+def sync_indexes(cursor):
+    """Create missing MANAGED_INDEXES and drop idx_submissions_* ones no longer listed."""
+    cursor.execute("SELECT name FROM sqlite_master WHERE type = 'index' AND tbl_name = 'submissions' AND name LIKE 'idx_submissions_%'")
+    for (name,) in cursor.fetchall():
+        if name not in MANAGED_INDEXES:
+            cursor.execute(f"DROP INDEX {name}")
+    for name, target in MANAGED_INDEXES.items():
+        cursor.execute(f"CREATE INDEX IF NOT EXISTS {name} ON {target}")
+    # Give the planner real selectivity figures for the new indexes
+    cursor.execute("ANALYZE")
+
+# (version, description, function). PRAGMA user_version records the last
+# one applied; append new steps, never edit or reorder applied ones. The
+# early steps tolerate databases that already have their objects, which
+# is what pre-versioning databases look like.
+MIGRATIONS = [
+    (1, "submissions table and legacy columns", migrate_base_schema),
+    (2, "keyset pagination index", migrate_keyset_index),
+    (3, "FTS5 search index", ensure_search_index),
+    (4, "multi-select option index", ensure_option_index),
+    (5, "monthly stats rollup", ensure_stats_rollup),
+    (6, "managed filter and sort indexes", sync_indexes),
+    (7, "change log for /api/changes", ensure_change_log),
+]
+SCHEMA_VERSION = MIGRATIONS[-1][0]
+
+def ensure_schema(conn):
+    """Apply any migrations newer than the database's user_version."""
+    version = conn.execute('PRAGMA user_version').fetchone()[0]
+    if version >= SCHEMA_VERSION:
+        return
+    cursor = conn.cursor()
+    for number, description, migrate in MIGRATIONS:
+        if number <= version:
+            continue
+        conn.execute('BEGIN IMMEDIATE')
+        try:
+            migrate(cursor)
+            cursor.execute(f'PRAGMA user_version = {number}')
+            conn.commit()
+        except Exception:
+            conn.rollback()
+            raise
+        logging.info(f"Applied schema migration {number}: {description}")
+
 def init_db():
     try:
         conn = get_db_connection()
-        cursor = conn.cursor()
-        cursor.execute('''
-            CREATE TABLE IF NOT EXISTS submissions (
-                id INTEGER PRIMARY KEY AUTOINCREMENT,
-                submitted_at TEXT NOT NULL DEFAULT (datetime('now','localtime')),
-                session_date TEXT NOT NULL,
-                client_id TEXT,
-                age TEXT,
-                contact_mode TEXT,
-                country TEXT,
-                language TEXT,
-                income_source TEXT,
-                visa_type TEXT,
-                ethnicity TEXT,
-                disability TEXT,
-                chronic_illness TEXT,
-                presenting_issues TEXT,
-                service_provided TEXT,
-                service_type TEXT,
-                practitioner TEXT,
-                group_type TEXT,
-                evaluation_tools TEXT
-            )
-        ''')
-        
-        # Schema migration: Add staff_member if not exists
-        cursor.execute("PRAGMA table_info(submissions)")
-        columns = [row['name'] for row in cursor.fetchall()]
-        if 'staff_member' not in columns:
-            cursor.execute("ALTER TABLE submissions ADD COLUMN staff_member TEXT")
-        if 'client_status' not in columns:
-            cursor.execute("ALTER TABLE submissions ADD COLUMN client_status TEXT")
-        if 'visit_number' not in columns:
-            cursor.execute("ALTER TABLE submissions ADD COLUMN visit_number TEXT")
-        if 'carer' not in columns:
-            cursor.execute("ALTER TABLE submissions ADD COLUMN carer TEXT DEFAULT 'No'")
-        if 'financial_hardship' not in columns:
-            cursor.execute("ALTER TABLE submissions ADD COLUMN financial_hardship TEXT DEFAULT 'No'")
-        if 'social_isolation' not in columns:
-            cursor.execute("ALTER TABLE submissions ADD COLUMN social_isolation TEXT DEFAULT 'No'")
-        if 'rural_postcode' not in columns:
-            cursor.execute("ALTER TABLE submissions ADD COLUMN rural_postcode TEXT DEFAULT 'No'")
-        if 'lgbtiq' not in columns:
-            cursor.execute("ALTER TABLE submissions ADD COLUMN lgbtiq TEXT DEFAULT 'No'")
-        if 'funding_stream' not in columns:
-            cursor.execute("ALTER TABLE submissions ADD COLUMN funding_stream TEXT")
-        if 'funding_option' not in columns:
-            cursor.execute("ALTER TABLE submissions ADD COLUMN funding_option TEXT")
-            
-        conn.commit()
+        # WAL is persistent in the database file, so it only needs setting once
+        conn.execute('PRAGMA journal_mode=WAL')
+        ensure_schema(conn)
+        publish_change_seq(latest_change_seq(conn))
         conn.close()
         logging.info("Database initialized successfully.")
     except Exception as e:
         logging.error(f"Failed to initialize database: {e}")
         sys.exit(1)
 
+class CountingWriter:
+    """Wraps the handler's wfile to count response bytes for metrics."""
+
+    def __init__(self, raw):
+        self.raw = raw
+        self.bytes_written = 0
+
+    def write(self, data):
+        self.bytes_written += len(data)
+        return self.raw.write(data)
+
+    def flush(self):
+        self.raw.flush()
+
+    def __getattr__(self, name):
+        # closed, close() etc., which StreamRequestHandler.finish() uses
+        return getattr(self.raw, name)
+
+KNOWN_ROUTES = {
+    '/', '/viewer', '/api/records', '/api/export', '/api/options', '/api/stats', '/api/metrics', '/api/clients/summary',
+    '/api/changes', '/api/shutdown', '/api/submit', '/api/submit/batch', '/api/import', '/api/restore',
+}
+
 class WomensHealthHandler(http.server.BaseHTTPRequestHandler):
+    # Persistent connections: every response carries Content-Length or
+    # chunked framing, so the browser can reuse the socket for its next fetch.
+    protocol_version = 'HTTP/1.1'
+    # Headers and body go out as separate writes; without TCP_NODELAY the
+    # body waits on the client's delayed ACK (~40 ms) on a reused socket.
+    disable_nagle_algorithm = True
+
+    def setup(self):
+        super().setup()
+        self.wfile = CountingWriter(self.wfile)
+
+    def handle(self):
+        """Serve requests until the client closes, idles out or a queued client needs this worker."""
+        self.close_connection = True
+        self.handle_one_request()
+        while not self.close_connection and self.wait_for_next_request():
+            self.handle_one_request()
+
+    def wait_for_next_request(self):
+        # A pipelined request may already sit in rfile's buffer, where select() cannot see it
+        if self.request_buffered():
+            return True
+        deadline = time.monotonic() + KEEPALIVE_TIMEOUT
+        while True:
+            remaining = deadline - time.monotonic()
+            if remaining <= 0 or not self.keep_alive_allowed():
+                # A request the client already sent is still served rather than dropped
+                return bool(select.select([self.connection], [], [], 0)[0])
+            readable, _, _ = select.select([self.connection], [], [], min(remaining, 0.25))
+            if readable:
+                return True
+
+    def request_buffered(self):
+        """True if bytes of another request can be read without waiting."""
+        timeout = self.connection.gettimeout()
+        self.connection.settimeout(0)  # peek() must not block when the buffer is empty
+        try:
+            return bool(self.rfile.peek(1))
+        except OSError:
+            return False
+        finally:
+            self.connection.settimeout(timeout)
+
+    def keep_alive_allowed(self):
+        """Only hold on to an idle connection while nobody is waiting for a worker."""
+        waiting = getattr(self.server, 'has_waiting_connections', None)
+        return KEEPALIVE_TIMEOUT > 0 and waiting is not None and not waiting()
+
+    def end_headers(self):
+        if not self.close_connection and not self.keep_alive_allowed():
+            self.send_header('Connection', 'close')
+        super().end_headers()
+
+    def handle_one_request(self):
+        """Serve one request and account its route, status, time and bytes."""
+        start = time.perf_counter()
+        self.command = None
+        self.response_status = None
+        self.wfile.bytes_written = 0
+        try:
+            super().handle_one_request()
+        finally:
+            if self.command:
+                route = route_label(self.command, self.path)
+                METRICS.observe('womenshealth_http_request_duration_seconds', time.perf_counter() - start,
+                                (('method', self.command), ('route', route)))
+                METRICS.inc('womenshealth_http_requests_total',
+                            (('method', self.command), ('route', route), ('status', str(self.response_status or 0))))
+                METRICS.inc('womenshealth_http_response_bytes_total', (('route', route),), self.wfile.bytes_written)
+
+    def send_response(self, code, message=None):
+        self.response_status = code
+        super().send_response(code, message)
+
     def do_GET(self):
         parsed_path = urllib.parse.urlparse(self.path)
         
@@ -144,13 +1068,25 @@ class WomensHealthHandler(http.server.BaseHTTPRequestHandler):
             self.serve_viewer()
         elif parsed_path.path == '/api/records':
             self.handle_get_records(parsed_path.query)
+        elif parsed_path.path == '/api/changes':
+            self.handle_get_changes(parsed_path.query)
         elif parsed_path.path == '/api/export':
             self.handle_export(parsed_path.query)
         elif parsed_path.path == '/api/options':
             self.handle_get_options()
+        elif parsed_path.path.startswith('/api/options/'):
+            self.handle_get_option_field(parsed_path.path[len('/api/options/'):], parsed_path.query)
+        elif parsed_path.path == '/api/stats':
+            self.handle_get_stats(parsed_path.query)
+        elif parsed_path.path == '/api/clients/summary':
+            self.handle_get_client_summary(parsed_path.query)
+        elif parsed_path.path.startswith('/api/clients/') and parsed_path.path.endswith('/history'):
+            self.handle_get_client_history(parsed_path.path[len('/api/clients/'):-len('/history')])
+        elif parsed_path.path == '/api/metrics':
+            self.handle_get_metrics()
         elif parsed_path.path == '/api/shutdown':
+            self.close_connection = True
             self.send_json_response(200, {"status": "ok", "message": "Server shutting down..."})
-            import threading
             threading.Thread(target=self.server.shutdown).start()
             return
         else:
@@ -159,6 +1095,10 @@ class WomensHealthHandler(http.server.BaseHTTPRequestHandler):
     def do_POST(self):
         if self.path == '/api/submit':
             self.handle_submit()
+        elif self.path == '/api/submit/batch':
+            self.handle_submit_batch()
+        elif self.path == '/api/import':
+            self.handle_import()
         elif self.path == '/api/restore':
             self.handle_restore()
         else:
@@ -180,16 +1120,19 @@ class WomensHealthHandler(http.server.BaseHTTPRequestHandler):
             self.send_json_response(400, {"status": "error", "message": "Invalid record ID"})
             return
         try:
-            conn = get_db_connection()
-            cursor = conn.cursor()
-            cursor.execute("SELECT id FROM submissions WHERE id = ?", (rid,))
-            if cursor.fetchone() is None:
-                conn.close()
+            with write_transaction() as conn:
+                cursor = conn.execute("DELETE FROM submissions WHERE id = ?", (rid,))
+                deleted = cursor.rowcount
+                if deleted:
+                    COLUMN_CACHE.rows_removed([rid])
+            if not deleted:
+                year = archived_year_of(get_thread_connection(), rid)
+                if year is not None:
+                    self.send_json_response(409, {"status": "error",
+                                                  "message": f"Record {rid} is in the {year} archive, which is read-only"})
+                    return
                 self.send_json_response(404, {"status": "error", "message": "Record not found"})
                 return
-            cursor.execute("DELETE FROM submissions WHERE id = ?", (rid,))
-            conn.commit()
-            conn.close()
             logging.info(f"Record {rid} deleted.")
             self.send_json_response(200, {"status": "ok", "deleted_id": rid})
         except Exception as e:
@@ -198,102 +1141,265 @@ class WomensHealthHandler(http.server.BaseHTTPRequestHandler):
 
     def serve_form(self):
         try:
-            if not os.path.exists(HTML_FORM_PATH):
+            if not self.send_static(FORM_ASSET):
+                body = b"Error: WomensHealth_DataForm.html not found."
                 self.send_response(404)
                 self.send_header('Content-type', 'text/plain')
+                self.send_header('Content-Length', str(len(body)))
                 self.end_headers()
-                self.wfile.write(b"Error: WomensHealth_DataForm.html not found.")
-                return
-
-            with open(HTML_FORM_PATH, 'rb') as f:
-                content = f.read()
-                self.send_response(200)
-                self.send_header('Content-type', 'text/html; charset=utf-8')
-                self.end_headers()
-                self.wfile.write(content)
+                self.wfile.write(body)
         except Exception as e:
             logging.error(f"Error serving form: {e}")
             self.send_error(500, "Internal Server Error")
 
     def handle_get_options(self):
         try:
-            data_path = os.path.join(APP_DIR, 'data.json')
-            if not os.path.exists(data_path):
+            if not self.send_static(OPTIONS_ASSET):
                 self.send_json_response(404, {"error": "data.json not found"})
-                return
-            with open(data_path, 'r', encoding='utf-8') as f:
-                content = f.read()
-            self.send_response(200)
-            self.send_header('Content-type', 'application/json; charset=utf-8')
-            self.end_headers()
-            self.wfile.write(content.encode('utf-8'))
         except Exception as e:
             logging.error(f"Error serving options: {e}")
             self.send_json_response(500, {"error": "Internal Server Error"})
 
+    def handle_get_option_field(self, rest, query_str):
+        """/api/options/<field> (that field's data.json entry) and /api/options/<field>/search?q=&limit=."""
+        try:
+            field, _, action = rest.partition('/')
+            field = urllib.parse.unquote(field)
+            fields = OPTION_INDEX.fields()
+            if fields is None:
+                self.send_json_response(404, {"error": "data.json not found"})
+                return
+            if field not in fields:
+                self.send_json_response(404, {"status": "error", "message": f"Unknown option field '{field}'"})
+                return
+            if action not in ('', 'search'):
+                self.send_json_response(404, {"status": "error", "message": "Not Found"})
+                return
+            if not action:
+                self.send_snapshot(fields[field].snapshot, OPTIONS_ASSET.content_type)
+                return
+
+            params = urllib.parse.parse_qs(query_str)
+            query = params.get('q', [''])[0]
+            try:
+                limit = min(max(int(params.get('limit', [OPTION_SEARCH_LIMIT])[0]), 1), 100)
+            except ValueError:
+                self.send_json_response(400, {"status": "error", "message": "limit must be a number"})
+                return
+            self.send_json_response(200, {
+                "field": field,
+                "query": query,
+                "results": OPTION_INDEX.search(field, query, limit),
+            })
+        except Exception as e:
+            logging.error(f"Error serving options for {rest}: {e}")
+            self.send_json_response(500, {"status": "error", "message": "Internal Server Error"})
+
     def serve_viewer(self):
         try:
-            if not os.path.exists(HTML_VIEWER_PATH):
+            if not self.send_static(VIEWER_ASSET):
+                body = b"Error: WomensHealth_Viewer.html not found."
                 self.send_response(404)
                 self.send_header('Content-type', 'text/plain')
+                self.send_header('Content-Length', str(len(body)))
                 self.end_headers()
-                self.wfile.write(b"Error: WomensHealth_Viewer.html not found.")
-                return
-
-            with open(HTML_VIEWER_PATH, 'rb') as f:
-                content = f.read()
-                self.send_response(200)
-                self.send_header('Content-type', 'text/html; charset=utf-8')
-                self.end_headers()
-                self.wfile.write(content)
+                self.wfile.write(body)
         except Exception as e:
             logging.error(f"Error serving viewer: {e}")
             self.send_error(500, "Internal Server Error")
 
+    def send_static(self, asset):
+        """Send a cached file, or 304 if the client's copy is current. False if missing."""
+        snapshot = asset.get()
+        if snapshot is None:
+            return False
+        self.send_snapshot(snapshot, asset.content_type)
+        return True
+
+    def send_snapshot(self, snapshot, content_type):
+        accepted = accepted_encodings(self.headers)
+        encoding = next((e for e in ('br', 'gzip') if e in accepted and e in snapshot.bodies), 'identity')
+        etag = snapshot.etags[encoding]
+
+        not_modified = etag_matches(self.headers.get('If-None-Match'), etag)
+        if not_modified:
+            self.send_response(304)
+        else:
+            self.send_response(200)
+            self.send_header('Content-type', content_type)
+            self.send_header('Content-Length', str(len(snapshot.bodies[encoding])))
+            if encoding != 'identity':
+                self.send_header('Content-Encoding', encoding)
+        self.send_header('ETag', etag)
+        self.send_header('Cache-Control', STATIC_CACHE_CONTROL)
+        self.send_header('Vary', 'Accept-Encoding')
+        self.end_headers()
+        if not not_modified:
+            self.wfile.write(snapshot.bodies[encoding])
+
     def handle_submit(self):
         try:
             content_length = int(self.headers.get('Content-Length', 0))
             post_data = self.rfile.read(content_length)
             data = json.loads(post_data)
 
-            # Validation
-            session_date = data.get('session_date')
-            if not session_date:
-                self.send_json_response(400, {"status": "error", "message": "session_date is required"})
+            try:
+                values = prepare_submission(data)
+            except ValueError as e:
+                self.send_json_response(400, {"status": "error", "message": str(e)})
                 return
 
-            # Prepare fields (handling multi-select join with '|')
-            fields = [
-                'session_date', 'client_id', 'staff_member', 'client_status', 'visit_number', 'age', 'carer', 'financial_hardship', 'social_isolation', 'rural_postcode', 'lgbtiq',
-                'funding_stream', 'funding_option', 'contact_mode', 
-                'country', 'language', 'income_source', 'visa_type', 'ethnicity',
-                'disability', 'chronic_illness', 'presenting_issues', 'service_provided',
-                'service_type', 'practitioner', 'group_type', 'evaluation_tools'
-            ]
-            
-            values = []
-            for field in fields:
-                val = data.get(field, "")
-                if isinstance(val, list):
-                    val = "|".join(val)
-                values.append(val)
-
-            conn = get_db_connection()
-            cursor = conn.cursor()
-            placeholders = ", ".join(["?"] * len(fields))
-            query = f"INSERT INTO submissions ({', '.join(fields)}) VALUES ({placeholders})"
-            cursor.execute(query, values)
-            row_id = cursor.lastrowid
-            conn.commit()
-            conn.close()
+            with write_transaction() as conn:
+                row_id = insert_submission(conn, values)
+                COLUMN_CACHE.rows_added([row_id])
 
             self.send_json_response(200, {"status": "ok", "id": row_id})
         except Exception as e:
             logging.error(f"Error in handle_submit: {e}")
             self.send_json_response(500, {"status": "error", "message": "Failed to save record"})
 
-    def _build_where_clause(self, params):
-        """Build a SQL WHERE clause + params list from a parsed query-string dict."""
+    def handle_submit_batch(self):
+        """Insert an array of submissions in one transaction.
+
+        Each entry is validated like /api/submit. Valid entries are saved
+        together; the response lists an id or an error for every entry, in
+        request order.
+        """
+        try:
+            content_length = int(self.headers.get('Content-Length', 0))
+            post_data = self.rfile.read(content_length)
+            data = json.loads(post_data)
+
+            if not isinstance(data, list):
+                self.send_json_response(400, {"status": "error", "message": "Expected a JSON array of submissions"})
+                return
+            if len(data) > SUBMIT_BATCH_LIMIT:
+                self.send_json_response(400, {"status": "error", "message": f"At most {SUBMIT_BATCH_LIMIT} submissions per batch"})
+                return
+
+            results = []
+            valid = []
+            for index, item in enumerate(data):
+                try:
+                    valid.append(prepare_submission(item))
+                    results.append({"index": index})
+                except ValueError as e:
+                    results.append({"index": index, "status": "error", "message": str(e)})
+
+            ids = []
+            if valid:
+                with write_transaction() as conn:
+                    ids = insert_submissions(conn, valid)
+                    COLUMN_CACHE.rows_added(ids)
+
+            new_ids = iter(ids)
+            for result in results:
+                if 'status' not in result:
+                    result.update({"status": "ok", "id": next(new_ids)})
+
+            logging.info(f"Batch submit: {len(ids)} saved, {len(data) - len(ids)} rejected.")
+            self.send_json_response(200, {
+                "status": "ok",
+                "saved": len(ids),
+                "rejected": len(data) - len(ids),
+                "results": results
+            })
+        except json.JSONDecodeError:
+            self.send_json_response(400, {"status": "error", "message": "Invalid JSON"})
+        except Exception as e:
+            logging.error(f"Error in handle_submit_batch: {e}")
+            self.send_json_response(500, {"status": "error", "message": "Failed to save records"})
+
+    def handle_import(self):
+        """Stream a CSV in the Export CSV layout into submissions.
+
+        Rows are validated against the form's options as they are read and saved
+        IMPORT_BATCH_SIZE at a time, each batch in its own transaction, so
+        memory stays flat and other users are never blocked for long. Valid
+        rows are saved; rejected ones are listed by line number with the
+        reason. id and submitted_at columns are ignored: imported rows get
+        new ones.
+        """
+        imported = 0
+        rejected = 0
+        errors = []
+        try:
+            try:
+                content_length = int(self.headers.get('Content-Length', 0))
+            except ValueError:
+                content_length = 0
+            if content_length <= 0:
+                self.send_json_response(400, {"status": "error", "message": "No file uploaded"})
+                return
+            body = RequestBody(self.rfile, content_length)
+            # Whatever happens, the body may not all have been read: never reuse the connection
+            self.close_connection = True
+            reader = csv.reader(io.TextIOWrapper(io.BufferedReader(body, RESTORE_CHUNK_SIZE),
+                                                 encoding='utf-8-sig', newline=''))
+
+            columns = [name.strip() for name in next(reader, [])]
+            if 'session_date' not in columns:
+                self.send_json_response(400, {"status": "error",
+                                              "message": "The first row must be the column headings, as written by Export CSV"})
+                return
+            ignored = [name for name in columns if name and name not in SUBMISSION_FIELDS and name not in ('id', 'submitted_at')]
+            vocabularies = import_vocabularies()
+
+            batch = []
+            for row in reader:
+                if not any(cell.strip() for cell in row):
+                    continue  # Blank line
+                try:
+                    if len(row) > len(columns):
+                        raise ValueError(f"{len(row)} values but only {len(columns)} column headings")
+                    batch.append(prepare_import_row(dict(zip(columns, row)), vocabularies))
+                except ValueError as e:
+                    rejected += 1
+                    if len(errors) < IMPORT_ERROR_LIMIT:
+                        errors.append({"line": reader.line_num, "message": str(e)})
+                    continue
+                if len(batch) >= IMPORT_BATCH_SIZE:
+                    imported += self._save_import_batch(batch)
+                    batch = []
+            if batch:
+                imported += self._save_import_batch(batch)
+            if body.incomplete:
+                raise ValueError("Upload was incomplete")
+
+            logging.info(f"CSV import: {imported} saved, {rejected} rejected.")
+            self.send_json_response(200, {
+                "status": "ok",
+                "imported": imported,
+                "rejected": rejected,
+                "errors": errors,
+                "ignored_columns": ignored,
+            })
+        except (ValueError, csv.Error) as e:
+            # UnicodeDecodeError is a ValueError too: not UTF-8 text
+            message = "The file is not UTF-8 text (in Excel, save as 'CSV UTF-8')" if isinstance(e, UnicodeDecodeError) else str(e)
+            logging.warning(f"CSV import stopped after {imported} saved, {rejected} rejected: {type(e).__name__}")
+            self.send_json_response(400, {"status": "error", "message": f"Import stopped: {message}",
+                                          "imported": imported, "rejected": rejected, "errors": errors})
+        except Exception as e:
+            logging.error(f"Error in handle_import: {e}")
+            self.send_json_response(500, {"status": "error", "message": "Failed to import records",
+                                          "imported": imported, "rejected": rejected, "errors": errors})
+
+    @staticmethod
+    def _save_import_batch(rows):
+        with write_transaction() as conn:
+            ids = insert_submissions(conn, rows)
+            COLUMN_CACHE.rows_added(ids)
+        return len(ids)
+
+    @staticmethod
+    def _build_where_clause(params, schema=None):
+        """Build a SQL WHERE clause + params list from a parsed query-string dict.
+
+        With `schema`, the tables its subqueries read are taken from that
+        database (main or an attached archive_<year>).
+        """
+        prefix = f"{schema}." if schema else ""
         where_clauses = []
         query_params = []
 
@@ -306,172 +1412,1661 @@ class WomensHealthHandler(http.server.BaseHTTPRequestHandler):
         if p('date_to'):
             where_clauses.append("session_date <= ?")
             query_params.append(p('date_to'))
-        if p('age'):
-            where_clauses.append("age = ?")
-            query_params.append(p('age'))
-        if p('contact_mode'):
-            where_clauses.append("contact_mode = ?")
-            query_params.append(p('contact_mode'))
+        for field in EXACT_FILTER_FIELDS:
+            if p(field):
+                where_clauses.append(f"{field} = ?")
+                query_params.append(p(field))
+
+        # --- Prefix filters (served by the NOCASE indexes) ---
+        for field in PREFIX_FILTER_FIELDS:
+            val = p(field)
+            if val:
+                where_clauses.append(f"{field} LIKE ? ESCAPE '\\'")
+                query_params.append(like_prefix(val))
 
         # --- Field-specific LIKE filters ---
-        like_fields = [
-            'client_id', 'staff_member', 'client_status', 'visit_number', 'carer', 'financial_hardship', 'social_isolation', 'rural_postcode', 'lgbtiq', 'funding_stream', 'funding_option', 'country', 'language', 'ethnicity',
-            'visa_type', 'income_source', 'disability', 'chronic_illness',
-            'presenting_issues', 'service_provided', 'service_type',
-            'practitioner', 'group_type', 'evaluation_tools',
-        ]
-        for field in like_fields:
+        for field in LIKE_FILTER_FIELDS:
             val = p(field)
             if val:
                 where_clauses.append(f"{field} LIKE ?")
                 query_params.append(f"%{val}%")
 
-        # --- Free-text search across all text fields ---
+        # --- Multi-select filters: indexed set membership on submission_options ---
+        # Options may be repeated params or pipe-separated; <field>_match=all
+        # requires every listed option, otherwise any one of them matches.
+        for field in MULTI_SELECT_FIELDS:
+            wanted = list({v.lower(): v for raw in params.get(field, []) for v in split_options(raw)}.values())
+            if not wanted:
+                continue
+            placeholders = ", ".join(["?"] * len(wanted))
+            subquery = f"SELECT submission_id FROM {prefix}submission_options WHERE field = ? AND value IN ({placeholders})"
+            query_params.append(field)
+            query_params.extend(wanted)
+            if p(f"{field}_match") == 'all' and len(wanted) > 1:
+                subquery += " GROUP BY submission_id HAVING COUNT(*) = ?"
+                query_params.append(len(wanted))
+            where_clauses.append(f"id IN ({subquery})")
+
+        # --- Free-text search across all text fields (FTS5 index) ---
         search = p('search')
-        if search:
-            search_term = f"%{search}%"
-            search_clauses = [
-                "client_id LIKE ?", "staff_member LIKE ?", "client_status LIKE ?", "visit_number LIKE ?",
-                "age LIKE ?", "contact_mode LIKE ?", "session_date LIKE ?",
-                "carer LIKE ?", "financial_hardship LIKE ?", "social_isolation LIKE ?", "rural_postcode LIKE ?", "lgbtiq LIKE ?", "funding_stream LIKE ?", "funding_option LIKE ?", "country LIKE ?",
-                "language LIKE ?", "ethnicity LIKE ?", "disability LIKE ?",
-                "chronic_illness LIKE ?", "presenting_issues LIKE ?",
-                "service_provided LIKE ?", "service_type LIKE ?",
-                "practitioner LIKE ?", "evaluation_tools LIKE ?",
-                "group_type LIKE ?", "visa_type LIKE ?", "income_source LIKE ?"
-            ]
-            where_clauses.append("(" + " OR ".join(search_clauses) + ")")
-            query_params.extend([search_term] * len(search_clauses))
+        match = fts_match_expression(search) if search else None
+        if match:
+            where_clauses.append(f"id IN (SELECT rowid FROM {prefix}submissions_fts WHERE submissions_fts MATCH ?)")
+            query_params.append(match)
 
         where_str = ""
         if where_clauses:
             where_str = " WHERE " + " AND ".join(where_clauses)
         return where_str, query_params
 
+    @staticmethod
+    def _records_page_query(params, where_str, query_params, per_page, offset, after_key=None):
+        """SQL + bind params for one /api/records page, and whether it is relevance-ranked."""
+        match = fts_match_expression(params.get('search', [''])[0])
+        if match and params.get('sort', [None])[0] == 'relevance':
+            # Best bm25 matches first; ranked pages are addressed by offset
+            rest_str, rest_params = WomensHealthHandler._build_where_clause(
+                {k: v for k, v in params.items() if k != 'search'})
+            records_query = (
+                "SELECT submissions.* FROM submissions"
+                " JOIN (SELECT rowid AS fts_id, rank AS fts_rank FROM submissions_fts WHERE submissions_fts MATCH ?)"
+                f" ON fts_id = submissions.id{rest_str}"
+                " ORDER BY fts_rank, session_date DESC, id DESC LIMIT ? OFFSET ?"
+            )
+            return records_query, [match] + rest_params + [per_page, offset], True
+        if after_key is not None:
+            keyset = "(session_date, id) < (?, ?)"
+            page_where = f"{where_str} AND {keyset}" if where_str else f" WHERE {keyset}"
+            records_query = f"SELECT * FROM submissions{page_where} ORDER BY session_date DESC, id DESC LIMIT ?"
+            return records_query, query_params + list(after_key) + [per_page], False
+        records_query = f"SELECT * FROM submissions{where_str} ORDER BY session_date DESC, id DESC LIMIT ? OFFSET ?"
+        return records_query, query_params + [per_page, offset], False
+
+    @staticmethod
+    def _export_query(where_str):
+        return f"SELECT * FROM submissions{where_str} ORDER BY session_date DESC, id DESC"
+
+    @staticmethod
+    def _changed_rows_query(where_str):
+        return f"SELECT * FROM submissions{where_str} ORDER BY id"
+
+    @staticmethod
+    def _partition_union(params, schemas, after_key=None):
+        """UNION ALL of the matching rows of each schema, + bind params.
+
+        SQLite answers an ORDER BY on the compound by merging the arms, each
+        read in order from its own date index.
+        """
+        arms = []
+        arm_params = []
+        for schema in schemas:
+            where_str, query_params = WomensHealthHandler._build_where_clause(params, schema)
+            if after_key is not None:
+                keyset = "(session_date, id) < (?, ?)"
+                where_str = f"{where_str} AND {keyset}" if where_str else f" WHERE {keyset}"
+                query_params = query_params + list(after_key)
+            arms.append(f"SELECT {', '.join(ARCHIVE_COLUMNS)} FROM {schema}.submissions{where_str}")
+            arm_params += query_params
+        return " UNION ALL ".join(arms), arm_params
+
+    @staticmethod
+    def _partitioned_page_query(params, schemas, per_page, offset, after_key=None):
+        """_records_page_query across main and attached archives.
+
+        Relevance-ranked pages end with an extra fts_rank column.
+        """
+        match = fts_match_expression(params.get('search', [''])[0])
+        if match and params.get('sort', [None])[0] == 'relevance':
+            rest = {k: v for k, v in params.items() if k != 'search'}
+            arms = []
+            arm_params = []
+            for schema in schemas:
+                rest_str, rest_params = WomensHealthHandler._build_where_clause(rest, schema)
+                arms.append(
+                    f"SELECT {', '.join(ARCHIVE_COLUMNS)}, fts_rank FROM {schema}.submissions"
+                    f" JOIN (SELECT rowid AS fts_id, rank AS fts_rank FROM {schema}.submissions_fts WHERE submissions_fts MATCH ?)"
+                    f" ON fts_id = id{rest_str}")
+                arm_params += [match] + rest_params
+            records_query = " UNION ALL ".join(arms) + " ORDER BY fts_rank, session_date DESC, id DESC LIMIT ? OFFSET ?"
+            return records_query, arm_params + [per_page, offset], True
+        union, union_params = WomensHealthHandler._partition_union(params, schemas, after_key)
+        if after_key is not None:
+            return f"{union} ORDER BY session_date DESC, id DESC LIMIT ?", union_params + [per_page], False
+        return f"{union} ORDER BY session_date DESC, id DESC LIMIT ? OFFSET ?", union_params + [per_page, offset], False
+
+    def _archive_schemas(self, conn, params):
+        """Schemas a filtered query must read: [] for the live file alone,
+        else main plus the archive years its date range reaches. Sends a 400
+        and returns None if the range reaches too many years.
+        """
+        years = archive_years_for(params.get('date_from', [None])[0], params.get('date_to', [None])[0])
+        if not years:
+            return []
+        try:
+            return ['main'] + attach_archives(conn, years)
+        except ValueError as e:
+            self.send_json_response(400, {"status": "error", "message": f"{e}; narrow the date range"})
+            return None
+
     def handle_get_records(self, query_str):
         try:
-            params = urllib.parse.parse_qs(query_str)
+            # A page can only change when a row does, so the change log's
+            # seq is its version. Read it (and the write generation) before
+            # querying: a write landing mid-request then leaves the tags
+            # older than the data, never newer.
+            generation = _write_generation
+            seq = _change_seq
+            etag = f'"{seq}"'
+            if etag_matches(self.headers.get('If-None-Match'), etag):
+                self.send_not_modified(etag)
+                return
 
-            page = int(params.get('page', [1])[0])
-            per_page = int(params.get('per_page', [50])[0])
+            params = urllib.parse.parse_qs(query_str)
+            try:
+                page = int(params.get('page', ['1'])[0])
+                per_page = int(params.get('per_page', ['50'])[0])
+            except ValueError:
+                page = per_page = None
+            if page is None or page < 1 or per_page is None or not 0 <= per_page <= RECORDS_PAGE_MAX:
+                self.send_json_response(400, {"status": "error", "message":
+                                              f"'page' must be 1 or more and 'per_page' 0 to {RECORDS_PAGE_MAX}"})
+                return
             offset = (page - 1) * per_page
 
+            # Paging back to a page already built since the last write costs no SQL
+            cache_key = RESULT_CACHE.key('/api/records', params, 'gzip' if accepts_gzip(self.headers) else 'identity')
+            hit = RESULT_CACHE.get(cache_key, generation)
+            if hit is not None:
+                self.send_json_body(200, *hit)
+                return
+
+            # Keyset pagination: 'after' names the last row of the previous
+            # page, so deep pages never scan and discard earlier rows.
+            after = params.get('after', [None])[0]
+            if after:
+                try:
+                    after_key = decode_cursor(after)
+                except ValueError:
+                    self.send_json_response(400, {"status": "error", "message": "Invalid 'after' cursor"})
+                    return
+
             where_str, query_params = self._build_where_clause(params)
 
-            conn = get_db_connection()
+            conn = get_thread_connection()
             cursor = conn.cursor()
+            cursor.row_factory = None  # Plain tuples: serialised as-is under one column header
 
-            # Count total
-            count_query = f"SELECT COUNT(*) as total FROM submissions{where_str}"
-            cursor.execute(count_query, query_params)
-            total = cursor.fetchone()['total']
+            schemas = self._archive_schemas(conn, params)
+            if schemas is None:
+                return
+            cached = None if schemas else COLUMN_CACHE.page(params, per_page, offset, after_key if after else None)
+            rows = None
+            if cached is not None:
+                # The cache picked the page's ids; SQLite only reads those rows
+                total, page_ids = cached
+                ids_str, ids_params = ids_where(page_ids)
+                records_query, records_params, ranked = self._records_page_query(
+                    {}, ids_str, ids_params, per_page, 0)
+                rows = self._fetch_page(cursor, records_query, records_params, ids_str)
+                if len(rows) < len(page_ids):
+                    rows = None  # A delete committed after the cache picked these ids: ask SQLite instead
+            if rows is None:
+                if schemas:
+                    # The date range reaches archived years: count each file, merge their rows
+                    total = sum(cached_count(conn, *self._build_where_clause(params, schema), f"{schema}.submissions")
+                                for schema in schemas)
+                    records_query, records_params, ranked = self._partitioned_page_query(
+                        params, schemas, per_page, offset, after_key if after else None)
+                else:
+                    # Count total (reused across pages of the same filter until the next write)
+                    total = cached_count(conn, where_str, query_params)
 
-            # Get records
-            records_query = f"SELECT * FROM submissions{where_str} ORDER BY session_date DESC, id DESC LIMIT ? OFFSET ?"
-            cursor.execute(records_query, query_params + [per_page, offset])
-            rows = cursor.fetchall()
+                    # Get records
+                    records_query, records_params, ranked = self._records_page_query(
+                        params, where_str, query_params, per_page, offset, after_key if after else None)
+                rows = self._fetch_page(cursor, records_query, records_params, where_str)
+            columns = [d[0] for d in cursor.description]
+            if columns[-1] == 'fts_rank':
+                columns = columns[:-1]
+                rows = [row[:-1] for row in rows]
 
-            records = [dict(row) for row in rows]
-            conn.close()
+            next_after = None
+            if rows and len(rows) == per_page and not ranked:
+                last = rows[-1]
+                next_after = encode_cursor(last[columns.index('session_date')], last[columns.index('id')])
 
-            self.send_json_response(200, {
+            response = {
                 "total": total,
                 "page": page,
                 "per_page": per_page,
-                "records": records
-            })
+                "next_after": next_after,
+                "seq": seq,
+                "archived_years": archive_years(),
+            }
+            if params.get('format', [None])[0] == 'objects':
+                # One object per record, for scripts written against the old response shape
+                response["records"] = [dict(zip(columns, row)) for row in rows]
+            else:
+                response["columns"] = columns
+                response["rows"] = rows
+            body, compressed = self.encode_json(response)
+            RESULT_CACHE.put(cache_key, generation, (body, compressed, etag), len(body))
+            self.send_json_body(200, body, compressed, etag)
         except Exception as e:
             logging.error(f"Error in handle_get_records: {e}")
             self.send_json_response(500, {"status": "error", "message": "Internal Database Error"})
 
-    def handle_export(self, query_str):
+    @staticmethod
+    def _fetch_page(cursor, records_query, records_params, where_str):
+        start = time.perf_counter()
+        cursor.execute(records_query, records_params)
+        rows = cursor.fetchall()
+        record_query('records_page', time.perf_counter() - start, len(rows), where_str, len(records_params))
+        return rows
+
+    def handle_get_changes(self, query_str):
+        """Row events after ?since=<seq>, oldest first, plus the current rows they touched.
+
+        With ?wait=<seconds> and nothing new yet, holds the request until a
+        write commits (long-poll). When events the client needs have been
+        trimmed, or a restore or archive replaced rows wholesale, answers
+        reset=true: reload from /api/records and continue from its seq.
+        """
         try:
             params = urllib.parse.parse_qs(query_str)
+            try:
+                since = int(params.get('since', ['0'])[0])
+                wait = min(max(float(params.get('wait', ['0'])[0]), 0), CHANGES_MAX_WAIT)
+            except ValueError:
+                self.send_json_response(400, {"status": "error", "message": "'since' and 'wait' must be numbers"})
+                return
+            if wait and since == _change_seq:
+                wait_for_change(since, wait)
 
-            where_str, query_params = self._build_where_clause(params)
-
-            conn = get_db_connection()
-            cursor = conn.cursor()
-            records_query = f"SELECT * FROM submissions{where_str} ORDER BY session_date DESC, id DESC"
-            cursor.execute(records_query, query_params)
-            rows = cursor.fetchall()
+            conn = get_thread_connection()
+            events = conn.execute(CHANGES_QUERY, (since, CHANGES_PAGE_LIMIT + 1)).fetchall()
+            more = len(events) > CHANGES_PAGE_LIMIT
+            events = events[:CHANGES_PAGE_LIMIT]
+            if events:
+                # seq has no gaps, so a jump means the events in between were trimmed
+                reset = events[0]['seq'] != since + 1 or any(e['op'] == 'reset' for e in events)
+                latest = events[-1]['seq']
+            else:
+                latest = latest_change_seq(conn)
+                reset = since > latest  # A seq this database never handed out
+            if reset:
+                self.send_json_response(200, {"since": since, "seq": latest_change_seq(conn), "reset": True,
+                                              "more": False, "changes": [], "columns": [], "rows": []})
+                return
 
-            # Stream CSV response
-            filename = f"womenshealth_export_{datetime.now().strftime('%Y-%m-%d')}.csv"
+            changed_ids = list(dict.fromkeys(e['submission_id'] for e in events if e['op'] != 'delete'))
+            columns, rows = [], []
+            if changed_ids:
+                where_str, query_params = ids_where(changed_ids)
+                cursor = conn.cursor()
+                cursor.row_factory = None
+                cursor.execute(self._changed_rows_query(where_str), query_params)
+                rows = cursor.fetchall()
+                columns = [d[0] for d in cursor.description]
+            self.send_json_response(200, {
+                "since": since,
+                "seq": latest,
+                "reset": False,
+                "more": more,
+                "changes": [{"seq": e['seq'], "op": e['op'], "id": e['submission_id']} for e in events],
+                "columns": columns,
+                "rows": rows,
+            })
+        except Exception as e:
+            logging.error(f"Error in handle_get_changes: {e}")
+            self.send_json_response(500, {"status": "error", "message": "Internal Database Error"})
 
-            self.send_response(200)
-            self.send_header('Content-Type', 'text/csv; charset=utf-8')
-            self.send_header('Content-Disposition', f'attachment; filename={filename}')
-            self.end_headers()
+    def handle_export(self, query_str):
+        headers_sent = False
+        try:
+            generation = _write_generation
+            params = urllib.parse.parse_qs(query_str)
+            compress = accepts_gzip(self.headers)
+            cache_key = RESULT_CACHE.key('/api/export', params, 'gzip' if compress else 'identity')
+            body = RESULT_CACHE.get(cache_key, generation)
+            if body is not None:
+                self.send_export_headers(compress, len(body))
+                self.wfile.write(body)
+                return
 
-            # Write BOM for Excel compatibility
-            self.wfile.write(b"\xef\xbb\xbf")
+            conn = get_thread_connection()
+            schemas = self._archive_schemas(conn, params)
+            if schemas is None:
+                return
+            where_str, query_params = self._build_where_clause(params)
+            if schemas:
+                union, query_params = self._partition_union(params, schemas)
+                export_query = f"{union} ORDER BY session_date DESC, id DESC"
+            else:
+                # Always SQL, not the columnar cache: rows stream from the cursor
+                # without first collecting every matching id
+                export_query = self._export_query(where_str)
 
-            output = io.StringIO()
-            writer = csv.writer(output)
+            cursor = conn.cursor()
+            start = time.perf_counter()
+            cursor.execute(export_query, query_params)
+            sql_seconds = time.perf_counter() - start
+            row_count = 0
+            columns = [d[0] for d in cursor.description]
 
-            if rows:
-                writer.writerow(rows[0].keys())
-                for row in rows:
-                    writer.writerow(list(row))
+            # Stream CSV response, keeping a copy for the result cache while it stays small enough
+            chunked = self.send_export_headers(compress)
+            headers_sent = True
+            out = ResponseStream(self.wfile, chunked=chunked, compress=compress,
+                                 capture_limit=RESULT_CACHE.max_entry_bytes())
 
-            self.wfile.write(output.getvalue().encode('utf-8'))
-            conn.close()
+            # Write BOM for Excel compatibility
+            out.write(b"\xef\xbb\xbf")
+
+            buffer = io.StringIO()
+            writer = csv.writer(buffer)
+            # Only the fetches count as SQL time; writing to a slow client does not
+            start = time.perf_counter()
+            rows = cursor.fetchmany(EXPORT_BATCH_SIZE)
+            sql_seconds += time.perf_counter() - start
+            if rows:
+                writer.writerow(columns)
+            while rows:
+                row_count += len(rows)
+                writer.writerows(rows)
+                out.write(buffer.getvalue().encode('utf-8'))
+                buffer.seek(0)
+                buffer.truncate()
+                start = time.perf_counter()
+                rows = cursor.fetchmany(EXPORT_BATCH_SIZE)
+                sql_seconds += time.perf_counter() - start
+            out.close()
+            record_query('export', sql_seconds, row_count, where_str, len(query_params))
+            if out.captured is not None:
+                body = b"".join(out.captured)
+                RESULT_CACHE.put(cache_key, generation, body, len(body))
         except Exception as e:
             logging.error(f"Error in handle_export: {e}")
-            self.send_error(500, "Internal Server Error during export")
+            if headers_sent:
+                # Too late for an error status; dropping the connection
+                # leaves the client with a visibly truncated download.
+                self.close_connection = True
+            else:
+                self.send_error(500, "Internal Server Error during export")
+
+    def send_export_headers(self, compress, length=None):
+        """Headers for a CSV download. Without a length the body is chunked
+        (HTTP/1.1) or ends with the connection; returns whether it is chunked."""
+        filename = f"womenshealth_export_{datetime.now().strftime('%Y-%m-%d')}.csv"
+        chunked = length is None and self.request_version == 'HTTP/1.1'
+        self.send_response(200)
+        self.send_header('Content-Type', 'text/csv; charset=utf-8')
+        self.send_header('Content-Disposition', f'attachment; filename={filename}')
+        self.send_header('Vary', 'Accept-Encoding')
+        if compress:
+            self.send_header('Content-Encoding', 'gzip')
+        if length is not None:
+            self.send_header('Content-Length', str(length))
+        elif chunked:
+            self.send_header('Transfer-Encoding', 'chunked')
+        else:
+            # No length known up front: the end of the body is the end of the connection
+            self.send_header('Connection', 'close')
+        self.end_headers()
+        return chunked
+
+    def handle_get_stats(self, query_str):
+        """Session counts per month and per reporting dimension.
+
+        Takes the same filters as /api/records. Whole-month date ranges with
+        no other filters are read straight from stats_monthly; anything
+        else is aggregated live from submissions.
+        """
+        try:
+            params = urllib.parse.parse_qs(query_str)
+            date_only = all(k in ('date_from', 'date_to') for k, v in params.items() if v and v[0])
+            months = None
+            if date_only:
+                months = month_aligned_range(params.get('date_from', [None])[0], params.get('date_to', [None])[0])
+
+            conn = get_thread_connection()
+            schemas = self._archive_schemas(conn, params)
+            if schemas is None:
+                return
+            # Every archive file keeps its own rollups; the sums below add them up
+            start = time.perf_counter()
+            rows = []
+            if months is not None:
+                source = 'rollup'
+                first, last = months
+                for schema in schemas or [None]:
+                    table = f"{schema}.stats_monthly" if schema else "stats_monthly"
+                    rows += conn.execute(
+                        f"SELECT month, dimension, value, sessions FROM {table}"
+                        " WHERE month >= ? AND month <= ? AND sessions > 0",
+                        (first or '', last or '9999-99')).fetchall()
+                record_query('stats_rollup', time.perf_counter() - start, len(rows))
+            else:
+                source = 'live'
+                for schema in schemas or [None]:
+                    stats_query, stats_params = self._live_stats_query(params, schema)
+                    rows += conn.execute(stats_query, stats_params).fetchall()
+                where_str, query_params = self._build_where_clause(params)
+                record_query('stats_live', time.perf_counter() - start, len(rows), where_str, len(query_params))
+
+            totals = {"total": 0}
+            by_month = {}
+            for month, dimension, value, sessions in rows:
+                month_stats = by_month.setdefault(month, {"total": 0})
+                if dimension == 'total':
+                    month_stats['total'] += sessions
+                    totals['total'] += sessions
+                    continue
+                dim = month_stats.setdefault(dimension, {})
+                dim[value] = dim.get(value, 0) + sessions
+                dim = totals.setdefault(dimension, {})
+                dim[value] = dim.get(value, 0) + sessions
+
+            self.send_json_response(200, {
+                "source": source,
+                "totals": totals,
+                "months": dict(sorted(by_month.items())),
+            })
+        except Exception as e:
+            logging.error(f"Error in handle_get_stats: {e}")
+            self.send_json_response(500, {"status": "error", "message": "Internal Database Error"})
+
+    @staticmethod
+    def _live_stats_query(params, schema=None):
+        """SQL + bind params yielding the same rows as stats_monthly for the filtered submissions."""
+        where_str, query_params = WomensHealthHandler._build_where_clause(params, schema)
+        submissions = f"{schema}.submissions" if schema else "submissions"
+        submission_options = f"{schema}.submission_options" if schema else "submission_options"
+        single = [d for d in STATS_DIMENSIONS if d not in MULTI_SELECT_FIELDS]
+        multi_list = ", ".join(f"'{d}'" for d in STATS_DIMENSIONS if d in MULTI_SELECT_FIELDS)
+
+        selects = [f"SELECT substr(session_date, 1, 7), 'total', '', COUNT(*) FROM {submissions}{where_str} GROUP BY 1"]
+        selects += [
+            f"SELECT substr(session_date, 1, 7), '{d}', coalesce({d}, ''), COUNT(*) FROM {submissions}{where_str} GROUP BY 1, 3"
+            for d in single
+        ]
+        selects.append(
+            "SELECT substr(s.session_date, 1, 7), o.field, o.value, COUNT(*)"
+            f" FROM {submission_options} o JOIN {submissions} s ON s.id = o.submission_id"
+            f" WHERE o.field IN ({multi_list}) AND s.id IN (SELECT id FROM {submissions}{where_str})"
+            " GROUP BY 1, 2, 3"
+        )
+        return " UNION ALL ".join(selects), query_params * len(selects)
+
+    def handle_get_metrics(self):
+        """Request, SQL and cache metrics in Prometheus text format."""
+        METRICS.set('womenshealth_write_generation', _write_generation)
+        METRICS.set('womenshealth_change_seq', _change_seq)
+        METRICS.set('womenshealth_change_waiters', _change_waiters)
+        METRICS.set('womenshealth_columnar_cache_rows', COLUMN_CACHE.row_count())
+        METRICS.set('womenshealth_result_cache_entries', len(RESULT_CACHE))
+        METRICS.set('womenshealth_result_cache_bytes', RESULT_CACHE.size_bytes())
+        body = METRICS.render().encode('utf-8')
+        self.send_response(200)
+        self.send_header('Content-Type', 'text/plain; version=0.0.4; charset=utf-8')
+        self.send_header('Content-Length', str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    @staticmethod
+    def _client_history_queries(table, client_id):
+        """(sql, params) of the summary, latest-profile and recent-sessions queries for one client in `table`."""
+        match = f"FROM {table} WHERE client_id = ? COLLATE NOCASE"
+        newest = "ORDER BY session_date DESC, id DESC"
+        # Visit numbers are typed by hand; only plain digits count towards the highest
+        summary = (
+            f"SELECT COUNT(*) AS sessions, MIN(session_date) AS first_session, MAX(session_date) AS last_session, "
+            f"MAX(CASE WHEN trim(visit_number) <> '' AND trim(visit_number) NOT GLOB '*[^0-9]*' "
+            f"THEN CAST(trim(visit_number) AS INTEGER) END) AS highest_visit {match}",
+            (client_id,))
+        latest = (
+            "SELECT " + ", ".join(
+                f"(SELECT json_array(session_date, id, {field}) {match} AND {field} <> '' {newest} LIMIT 1) AS {field}"
+                for field in CLIENT_PROFILE_FIELDS),
+            (client_id,) * len(CLIENT_PROFILE_FIELDS))
+        history = (f"SELECT {', '.join(CLIENT_HISTORY_COLUMNS)} {match} {newest} LIMIT ?",
+                   (client_id, CLIENT_HISTORY_LIMIT))
+        return summary, latest, history
+
+    @staticmethod
+    def _client_history_part(conn, table, client_id):
+        """Summary row, newest non-empty profile values and most recent sessions of one client in `table`.
+
+        Profile values come back as {field: [session_date, id, value]} so
+        parts from several files can be merged by recency.
+        """
+        summary_query, latest_query, history_query = WomensHealthHandler._client_history_queries(table, client_id)
+        summary = conn.execute(*summary_query).fetchone()
+        if not summary['sessions']:
+            return summary, {}, []
+        latest_row = conn.execute(*latest_query).fetchone()
+        latest = {field: json.loads(latest_row[field]) for field in CLIENT_PROFILE_FIELDS if latest_row[field]}
+        history = conn.execute(*history_query).fetchall()
+        return summary, latest, history
+
+    def handle_get_client_history(self, quoted_id):
+        """Earlier sessions of one client (exact, case-insensitive id), their latest details and next visit number."""
+        try:
+            client_id = urllib.parse.unquote(quoted_id).strip()
+            if not client_id or '/' in client_id:
+                self.send_json_response(400, {"status": "error", "message": "Invalid client ID"})
+                return
+
+            conn = get_thread_connection()
+            start = time.perf_counter()
+            # Served by idx_submissions_client_id (client_id COLLATE NOCASE, session_date):
+            # counts and dates are aggregated and only the listed sessions are fetched
+            parts = [self._client_history_part(conn, 'submissions', client_id)]
+            # Archived sessions count too: visit numbers and New/Returning depend on them
+            years = archive_years()
+            for schemas in attached_archive_chunks(conn, years):
+                for schema in schemas:
+                    parts.append(self._client_history_part(conn, f"{schema}.submissions", client_id))
+
+            summaries = [summary for summary, _, _ in parts if summary['sessions']]
+            sessions = sum(summary['sessions'] for summary in summaries)
+            latest = {}
+            for _, part_latest, _ in parts:
+                for field, candidate in part_latest.items():
+                    if field not in latest or candidate[:2] > latest[field][:2]:
+                        latest[field] = candidate
+            history = [row for _, _, part_history in parts for row in part_history]
+            if years:
+                history.sort(key=lambda row: (row['session_date'], row['id']), reverse=True)
+            history = history[:CLIENT_HISTORY_LIMIT]
+            record_query('client_history', time.perf_counter() - start, len(history), " WHERE client_id = ?", 1)
+
+            # Visit numbers are typed by hand and may count visits from before
+            # this app; never suggest one at or below a number already used.
+            highest_visit = max((summary['highest_visit'] for summary in summaries
+                                 if summary['highest_visit'] is not None), default=0)
+
+            self.send_json_response(200, {
+                "client_id": client_id,
+                "client_status": "Returning" if sessions else "New",
+                "sessions": sessions,
+                "first_session": min((summary['first_session'] for summary in summaries), default=None),
+                "last_session": max((summary['last_session'] for summary in summaries), default=None),
+                "next_visit_number": max(sessions, highest_visit) + 1,
+                "latest": {field: candidate[2] for field, candidate in latest.items()},
+                "history": [dict(row) for row in history],
+            })
+        except Exception as e:
+            logging.error(f"Error in handle_get_client_history: {e}")
+            self.send_json_response(500, {"status": "error", "message": "Internal Database Error"})
+
+    def handle_get_client_summary(self, query_str):
+        """Distinct clients seen between date_from and date_to, split into new and returning.
+
+        A client is returning if they have any session before date_from.
+        """
+        try:
+            params = urllib.parse.parse_qs(query_str)
+            date_from = params.get('date_from', [''])[0]
+            date_to = params.get('date_to', [''])[0] or '9999-12-31'
+
+            conn = get_thread_connection()
+            range_years = archive_years_for(date_from, date_to)
+            earlier_years = [year for year in archive_years() if date_from[:4].isdigit() and year <= int(date_from[:4])]
+            if range_years or earlier_years:
+                self.send_json_response(200, {
+                    "date_from": date_from or None,
+                    "date_to": params.get('date_to', [None])[0],
+                    **self._partitioned_client_summary(conn, date_from, date_to, range_years, earlier_years),
+                })
+                return
+
+            start = time.perf_counter()
+            row = conn.execute(*self._client_summary_query(date_from, date_to)).fetchone()
+            record_query('client_summary', time.perf_counter() - start, row['clients'],
+                         " WHERE session_date >= ? AND session_date <= ?", 3)
+
+            new_clients = row['new_clients'] or 0
+            self.send_json_response(200, {
+                "date_from": date_from or None,
+                "date_to": params.get('date_to', [None])[0],
+                "clients": row['clients'],
+                "new_clients": new_clients,
+                "returning_clients": row['clients'] - new_clients,
+                "sessions": row['sessions'] or 0,
+            })
+        except Exception as e:
+            logging.error(f"Error in handle_get_client_summary: {e}")
+            self.send_json_response(500, {"status": "error", "message": "Internal Database Error"})
+
+    @staticmethod
+    def _client_summary_query(date_from, date_to):
+        """(sql, params) counting clients, new clients and sessions between the dates in the live file."""
+        # Clients come from the date index; each one is then a single
+        # seek into idx_submissions_client_id for an earlier session.
+        return '''
+                SELECT COUNT(*) AS clients,
+                       SUM(sessions) AS sessions,
+                       SUM(NOT EXISTS (SELECT 1 FROM submissions p
+                                       WHERE p.client_id = c.cid COLLATE NOCASE AND p.session_date < ?)) AS new_clients
+                FROM (SELECT client_id COLLATE NOCASE AS cid, COUNT(*) AS sessions FROM submissions
+                      WHERE session_date >= ? AND session_date <= ? AND client_id != ''
+                      GROUP BY 1) c
+            ''', (date_from, date_from, date_to)
+
+    @staticmethod
+    def _client_summary_scan_queries(schema, date_from, date_to):
+        """(sql, params) of one file's clients in the range, and of its clients seen before date_from."""
+        in_range = (f"SELECT client_id, COUNT(*) FROM {schema}.submissions"
+                    " WHERE session_date >= ? AND session_date <= ? AND client_id != ''"
+                    " GROUP BY client_id COLLATE NOCASE", (date_from, date_to))
+        before = (f"SELECT DISTINCT client_id COLLATE NOCASE FROM {schema}.submissions"
+                  " WHERE session_date < ? AND client_id != ''", (date_from,))
+        return in_range, before
+
+    @staticmethod
+    def _partitioned_client_summary(conn, date_from, date_to, range_years, earlier_years):
+        """handle_get_client_summary's counts when archive files hold part of the history.
+
+        Each file is asked for its clients in the range and its clients seen
+        before date_from; ids are then compared the way COLLATE NOCASE does.
+        """
+        start = time.perf_counter()
+        sessions_by_client = {}
+        earlier = set()
+
+        def scan(schema, in_range, before):
+            range_query, before_query = WomensHealthHandler._client_summary_scan_queries(schema, date_from, date_to)
+            if in_range:
+                for client, sessions in conn.execute(*range_query):
+                    key = ascii_lower(client)
+                    sessions_by_client[key] = sessions_by_client.get(key, 0) + sessions
+            if before:
+                earlier.update(ascii_lower(client) for client, in conn.execute(*before_query))
+
+        scan('main', True, bool(date_from))
+        for schemas in attached_archive_chunks(conn, sorted(set(range_years) | set(earlier_years))):
+            for schema in schemas:
+                year = int(schema[len('archive_'):])
+                scan(schema, year in range_years, year in earlier_years)
+        record_query('client_summary', time.perf_counter() - start, len(sessions_by_client),
+                     " WHERE session_date >= ? AND session_date <= ?", 2)
+
+        new_clients = sum(1 for client in sessions_by_client if client not in earlier)
+        return {
+            "clients": len(sessions_by_client),
+            "new_clients": new_clients,
+            "returning_clients": len(sessions_by_client) - new_clients,
+            "sessions": sum(sessions_by_client.values()),
+        }
 
     def handle_restore(self):
+        temp_path = None
         try:
             content_length = int(self.headers.get('Content-Length', 0))
             if content_length == 0:
                 self.send_json_response(400, {"status": "error", "message": "No file uploaded"})
                 return
-                
-            uploaded_db = self.rfile.read(content_length)
-            
+
+            # Stream the upload to a temp file next to the live database
+            # rather than holding the whole thing in memory.
+            fd, temp_path = tempfile.mkstemp(prefix='restore_', suffix='.db', dir=APP_DIR)
+            with os.fdopen(fd, 'wb') as f:
+                header = self.rfile.read(min(16, content_length))
+                f.write(header)
+                remaining = content_length - len(header)
+                while remaining > 0:
+                    chunk = self.rfile.read(min(RESTORE_CHUNK_SIZE, remaining))
+                    if not chunk:
+                        break
+                    f.write(chunk)
+                    remaining -= len(chunk)
+
             # Simple magic bytes check for SQLite3 DB
-            if not uploaded_db.startswith(b'SQLite format 3\x00'):
+            if header != b'SQLite format 3\x00':
                 self.send_json_response(400, {"status": "error", "message": "Invalid database file format"})
                 return
-                
-            with open(DB_PATH, 'wb') as f:
-                f.write(uploaded_db)
-                
+            if remaining > 0:
+                self.send_json_response(400, {"status": "error", "message": "Upload was incomplete"})
+                return
+
+            problem = prepare_restore_file(temp_path)
+            if problem:
+                self.send_json_response(400, {"status": "error", "message": problem})
+                return
+
+            # Swap the checked copy in. The backup API writes it into the
+            # live database as one transaction, so other connections see
+            # either the old data or the new, never a half-copied file.
+            with _write_lock:
+                floor = _change_seq
+                source = sqlite3.connect(temp_path)
+                target = get_db_connection()
+                try:
+                    source.backup(target)
+                    target.execute('PRAGMA journal_mode=WAL')
+                finally:
+                    source.close()
+                    target.close()
+                reset_connections()
+                COLUMN_CACHE.rebuild()
+                with write_transaction() as conn:
+                    log_change_reset(conn, floor)
+
             logging.info("Database restored from backup.")
             self.send_json_response(200, {"status": "ok", "message": "Database restored successfully"})
         except Exception as e:
             logging.error(f"Error restoring database: {e}")
             self.send_json_response(500, {"status": "error", "message": "Internal Server Error during restore"})
+        finally:
+            if temp_path:
+                for path in (temp_path, temp_path + '-wal', temp_path + '-shm', temp_path + '-journal'):
+                    try:
+                        os.remove(path)
+                    except OSError:
+                        pass
+
+    def send_json_response(self, status_code, data, etag=None):
+        self.send_json_body(status_code, *self.encode_json(data), etag)
+
+    def encode_json(self, data):
+        """(body, compressed): gzipped when large enough and the client accepts it."""
+        body = json.dumps(data, separators=(',', ':')).encode('utf-8')
+        compress = len(body) >= JSON_GZIP_MIN_BYTES and accepts_gzip(self.headers)
+        if compress:
+            body = gzip.compress(body, compresslevel=JSON_GZIP_LEVEL, mtime=0)
+        return body, compress
 
-    def send_json_response(self, status_code, data):
+    def send_json_body(self, status_code, body, compress, etag=None):
         self.send_response(status_code)
         self.send_header('Content-type', 'application/json')
+        self.send_header('Content-Length', str(len(body)))
+        self.send_header('Vary', 'Accept-Encoding')
+        if compress:
+            self.send_header('Content-Encoding', 'gzip')
+        if etag:
+            # Weak: the same data under either encoding
+            self.send_header('ETag', 'W/' + etag)
+            self.send_header('Cache-Control', 'no-cache')
         self.end_headers()
-        self.wfile.write(json.dumps(data).encode('utf-8'))
+        self.wfile.write(body)
+
+    def send_not_modified(self, etag):
+        self.send_response(304)
+        self.send_header('ETag', 'W/' + etag)
+        self.send_header('Cache-Control', 'no-cache')
+        self.send_header('Vary', 'Accept-Encoding')
+        self.end_headers()
+
+def accepted_encodings(headers):
+    """Content codings the request's Accept-Encoding allows (ignoring q=0 entries)."""
+    accepted = set()
+    for part in headers.get('Accept-Encoding', '').split(','):
+        coding, _, qvalue = part.strip().partition(';')
+        coding = coding.strip().lower()
+        if not coding or qvalue.replace(' ', '').lower() in ('q=0', 'q=0.0', 'q=0.00', 'q=0.000'):
+            continue
+        if coding == '*':
+            accepted.update(('gzip', 'br'))
+        else:
+            accepted.add(coding)
+    return accepted
+
+def accepts_gzip(headers):
+    return 'gzip' in accepted_encodings(headers)
+
+def etag_matches(if_none_match, etag):
+    """Weak comparison of an If-None-Match header against one of our ETags."""
+    if not if_none_match:
+        return False
+    if if_none_match.strip() == '*':
+        return True
+    return any(tag.strip().removeprefix('W/') == etag for tag in if_none_match.split(','))
+
+class StaticAsset:
+    """A file served from memory, re-read only when its mtime or size changes.
+
+    Each load also prepares the gzip (and, if the brotli package is
+    installed, br) bodies once, so per-request cost is a stat() call.
+    """
+
+    class Snapshot:
+        def __init__(self, bodies, etags):
+            self.bodies = bodies
+            self.etags = etags
+
+    def __init__(self, path, content_type):
+        self.path = path
+        self.content_type = content_type
+        self._stamp = None
+        self._snapshot = None
+        self._lock = threading.Lock()
+
+    def get(self):
+        """Current Snapshot, or None if the file does not exist."""
+        try:
+            st = os.stat(self.path)
+        except FileNotFoundError:
+            return None
+        stamp = (st.st_mtime_ns, st.st_size)
+        if stamp != self._stamp:
+            with self._lock:
+                if stamp != self._stamp:
+                    self._load(stamp)
+        return self._snapshot
+
+    def _load(self, stamp):
+        with open(self.path, 'rb') as f:
+            body = f.read()
+        self._snapshot = static_snapshot(body)
+        self._stamp = stamp
+        logging.info(f"Loaded {os.path.basename(self.path)} into static cache ({len(body)} bytes)")
+
+def static_snapshot(body):
+    """StaticAsset.Snapshot for `body`: precompressed variants plus an ETag for each."""
+    digest = hashlib.sha1(body).hexdigest()[:20]
+    bodies = {'identity': body, 'gzip': gzip.compress(body, 9, mtime=0)}
+    if brotli is not None:
+        bodies['br'] = brotli.compress(body)
+    etags = {enc: f'"{digest}"' if enc == 'identity' else f'"{digest}-{enc}"' for enc in bodies}
+    return StaticAsset.Snapshot(bodies, etags)
+
+FORM_ASSET = StaticAsset(HTML_FORM_PATH, 'text/html; charset=utf-8')
+VIEWER_ASSET = StaticAsset(HTML_VIEWER_PATH, 'text/html; charset=utf-8')
+OPTIONS_ASSET = StaticAsset(DATA_JSON_PATH, 'application/json; charset=utf-8')
+
+def fold(text):
+    """Lowercase and strip accents, so 'cote' finds "Côte d'Ivoire"."""
+    decomposed = unicodedata.normalize('NFKD', str(text).lower())
+    return ''.join(c for c in decomposed if not unicodedata.combining(c))
+
+def option_leaves(node, group=''):
+    """(value, label, group) for every selectable option under a data.json entry."""
+    if isinstance(node, str):
+        return [(node, node, group)]
+    if isinstance(node, list):
+        return [leaf for child in node for leaf in option_leaves(child, group)]
+    if 'value' in node:
+        return [(node['value'], node.get('label', node['value']), group)]
+    group = group or node.get('tier1') or node.get('group') or node.get('name') or ''
+    return [leaf for key, child in node.items() if key not in ('tier1', 'name', 'group', 'label')
+            for leaf in option_leaves(child, group)]
+
+class OptionIndex:
+    """Per-field views of data.json for /api/options/<field> and its typeahead search.
+
+    Rebuilt whenever OPTIONS_ASSET reloads data.json. Each field keeps its
+    own JSON (as a static snapshot) and a map from every token prefix of
+    every option label to the options containing it. Matches are ranked by
+    how often the value appears in saved submissions.
+    """
+
+    class Field:
+        def __init__(self, snapshot, options, prefixes):
+            self.snapshot = snapshot    # StaticAsset.Snapshot of data.json[field]
+            self.options = options      # [(value, label, group)]
+            self.prefixes = prefixes    # folded token prefix -> set of positions in options
+
+    def __init__(self, source):
+        self.source = source
+        self._source_snapshot = None
+        self._fields = {}
+        self._usage = {}                # field -> (write generation, monotonic time, {value: uses})
+        self._lock = threading.Lock()
+
+    def fields(self):
+        """Field name -> OptionIndex.Field, or None if data.json is missing."""
+        snapshot = self.source.get()
+        if snapshot is None:
+            return None
+        if snapshot is not self._source_snapshot:
+            with self._lock:
+                if snapshot is not self._source_snapshot:
+                    self._build(snapshot)
+        return self._fields
+
+    def _build(self, snapshot):
+        data = json.loads(snapshot.bodies['identity'])
+        fields = {}
+        for field, entries in data.items():
+            options = list({leaf[0]: leaf for leaf in option_leaves(entries)}.values())
+            prefixes = {}
+            for position, (value, label, group) in enumerate(options):
+                for token in set(re.findall(r'\w+', fold(label))):
+                    for end in range(1, len(token) + 1):
+                        prefixes.setdefault(token[:end], set()).add(position)
+            body = json.dumps(entries, separators=(',', ':')).encode('utf-8')
+            fields[field] = OptionIndex.Field(static_snapshot(body), options, prefixes)
+        self._fields = fields
+        self._source_snapshot = snapshot
+        logging.info(f"Built option index for {len(fields)} fields ({sum(len(f.options) for f in fields.values())} options)")
+
+    @staticmethod
+    def usage_query(field):
+        """(sql, params) counting submissions per option of `field`, or None if no column holds it."""
+        if field in MULTI_SELECT_FIELDS:
+            return "SELECT value, COUNT(*) FROM submission_options WHERE field = ? GROUP BY value", (field,)
+        if field in SUBMISSION_FIELDS:
+            return f"SELECT {field}, COUNT(*) FROM submissions WHERE {field} != '' GROUP BY {field}", ()
+        return None
+
+    def usage(self, field):
+        """{lowercased value: submissions using it}, recounted after writes at most every OPTION_USAGE_REFRESH_SECONDS."""
+        generation = _write_generation
+        now = time.monotonic()
+        cached = self._usage.get(field)
+        if cached is not None and (cached[0] == generation or now - cached[1] < OPTION_USAGE_REFRESH_SECONDS):
+            return cached[2]
+
+        conn = get_thread_connection()
+        start = time.perf_counter()
+        query = self.usage_query(field)
+        rows = conn.execute(*query).fetchall() if query else []
+        record_query('option_usage', time.perf_counter() - start, len(rows))
+
+        counts = {}
+        for value, uses in rows:
+            key = str(value).lower()
+            counts[key] = counts.get(key, 0) + uses
+        self._usage[field] = (generation, now, counts)
+        return counts
+
+    def search(self, field, query, limit):
+        """Options of `field` whose label has a word starting with each word of `query`, most used first."""
+        entry = self.fields()[field]
+        tokens = re.findall(r'\w+', fold(query))
+        if tokens:
+            matches = set.intersection(*(entry.prefixes.get(t, set()) for t in tokens))
+        else:
+            matches = range(len(entry.options))
+        usage = self.usage(field)
+        ranked = sorted(matches, key=lambda i: (-usage.get(entry.options[i][0].lower(), 0), fold(entry.options[i][1])))
+        results = []
+        for i in ranked[:limit]:
+            value, label, group = entry.options[i]
+            results.append({"value": value, "label": label, "group": group, "uses": usage.get(value.lower(), 0)})
+        return results
+
+OPTION_INDEX = OptionIndex(OPTIONS_ASSET)
+
+_ASCII_LOWER = str.maketrans('ABCDEFGHIJKLMNOPQRSTUVWXYZ', 'abcdefghijklmnopqrstuvwxyz')
+
+def ascii_lower(text):
+    """Lowercase A-Z only, which is how SQLite's LIKE and NOCASE compare."""
+    return text.translate(_ASCII_LOWER)
+
+def popcount(mask):
+    return mask.bit_count() if hasattr(mask, 'bit_count') else bin(mask).count('1')
+
+def positions_mask(positions, start=0):
+    """Bitmask with the given row positions set; all positions must be >= start.
+
+    Built through a bytearray so adding many rows costs one big-int
+    conversion rather than one big-int OR per row.
+    """
+    start &= ~7
+    bits = bytearray(((max(positions) - start) >> 3) + 1)
+    for position in positions:
+        position -= start
+        bits[position >> 3] |= 1 << (position & 7)
+    return int.from_bytes(bits, 'little') << start
+
+class ColumnarCache:
+    """In-memory, dictionary-encoded copy of the filterable submissions columns.
+
+    Rows are numbered by position in id order. Every distinct value of a
+    column gets a small integer code, and each code keeps a bitmask (a
+    Python int, bit n = row position n) of the rows holding it, so a
+    filter is a handful of AND/OR operations over those masks. LIKE
+    filters are answered by testing each distinct value once instead of
+    every row. Multi-select fields keep one bitset of option codes per row.
+
+    Only ids come out of the cache; the rows themselves are still read
+    from SQLite. Anything the cache cannot answer (free-text search,
+    client_id, LIKE wildcards in a filter value) returns None and the
+    caller falls back to SQL.
+    """
+
+    COLUMNS = ['session_date', 'staff_member'] + EXACT_FILTER_FIELDS + LIKE_FILTER_FIELDS
+
+    class Column:
+        """One dictionary-encoded column: a code per row plus a row mask per code."""
+
+        def __init__(self):
+            self.codes = array('H')     # row position -> code; widened to 'I' past 65535 values
+            self.values = []            # code -> value
+            self.folded = []            # code -> ascii_lower(value), for LIKE matching
+            self.lookup = {}            # value -> code
+            self.masks = []             # code -> rows holding it
+
+        def code_for(self, value):
+            code = self.lookup.get(value)
+            if code is None:
+                code = self.lookup[value] = len(self.values)
+                self.values.append(value)
+                self.folded.append(ascii_lower(value))
+                self.masks.append(0)
+                if code > 0xFFFF and self.codes.typecode == 'H':
+                    self.codes = array('I', self.codes)
+            return code
+
+        def add(self, code, positions, base):
+            self.masks[code] |= positions_mask(positions, base)
+
+        def discard(self, code, position, keep):
+            self.masks[code] &= keep
+
+    class DateColumn(Column):
+        """session_date, whose masks are split into BLOCK-row blocks: code -> {block: mask}.
+
+        There are thousands of dates and each one's rows sit close together,
+        so a date costs a block or two rather than a mask as long as the
+        table. Block dicts are replaced, never changed in place, so a
+        snapshot taken under the lock stays consistent.
+        """
+
+        BLOCK = 4096
+
+        def code_for(self, value):
+            known = len(self.values)
+            code = super().code_for(value)
+            if code == known:
+                self.masks[code] = {}
+            return code
+
+        def add(self, code, positions, base):
+            grouped = {}
+            for position in positions:
+                grouped.setdefault(position // self.BLOCK, []).append(position % self.BLOCK)
+            blocks = dict(self.masks[code])
+            for block, offsets in grouped.items():
+                blocks[block] = blocks.get(block, 0) | positions_mask(offsets)
+            self.masks[code] = blocks
+
+        def discard(self, code, position, keep):
+            block, offset = divmod(position, self.BLOCK)
+            blocks = dict(self.masks[code])
+            remaining = blocks.get(block, 0) & ~(1 << offset)
+            if remaining:
+                blocks[block] = remaining
+            else:
+                blocks.pop(block, None)
+            self.masks[code] = blocks
+
+        def mask_of(self, codes):
+            """Plain row mask of every row holding one of `codes`."""
+            merged = {}
+            for code in codes:
+                for block, mask in self.masks[code].items():
+                    merged[block] = merged.get(block, 0) | mask
+            if not merged:
+                return 0
+            size = self.BLOCK // 8
+            return int.from_bytes(b''.join(merged.get(block, 0).to_bytes(size, 'little')
+                                           for block in range(max(merged) + 1)), 'little')
+
+    class OptionColumn:
+        """A multi-select field: per-row bitset of option codes plus a row mask per option."""
+
+        def __init__(self):
+            self.options = []           # row position -> bitset of option codes
+            self.lookup = {}            # ascii_lower(option) -> code
+            self.masks = []             # code -> rows with that option
+
+        def code_for(self, option):
+            key = ascii_lower(option)
+            code = self.lookup.get(key)
+            if code is None:
+                code = self.lookup[key] = len(self.masks)
+                self.masks.append(0)
+            return code
+
+    class Store:
+        """The cached data itself; replaced wholesale by each rebuild."""
+
+        def __init__(self):
+            self.ids = array('q')       # row position -> submission id, ascending
+            self.live = 0               # rows not deleted since they were added
+            self.columns = {name: (ColumnarCache.DateColumn if name == 'session_date' else ColumnarCache.Column)()
+                            for name in ColumnarCache.COLUMNS}
+            self.options = {name: ColumnarCache.OptionColumn() for name in MULTI_SELECT_FIELDS}
+            self.dates = []             # distinct session_date values, sorted
+
+        def add_rows(self, rows):
+            """Append rows of (id, *COLUMNS, *MULTI_SELECT_FIELDS); ids must be ascending and new."""
+            base = len(self.ids)
+            if rows and self.ids and rows[0][0] <= self.ids[-1]:
+                rows = [row for row in rows if row[0] > self.ids[-1]]
+            if not rows:
+                return
+            known_dates = len(self.columns['session_date'].values)
+            self.ids.extend(row[0] for row in rows)
+            # Column at a time, with a per-call map from raw values to codes
+            for i, name in enumerate(ColumnarCache.COLUMNS, 1):
+                column = self.columns[name]
+                raw_codes = {}
+                added = {}              # code -> new positions
+                for position, row in enumerate(rows, base):
+                    value = row[i]
+                    code = raw_codes.get(value)
+                    if code is None:
+                        code = raw_codes[value] = column.code_for('' if value is None else str(value))
+                    column.codes.append(code)
+                    positions = added.get(code)
+                    if positions is None:
+                        added[code] = [position]
+                    else:
+                        positions.append(position)
+                for code, positions in added.items():
+                    column.add(code, positions, base)
+            for i, name in enumerate(MULTI_SELECT_FIELDS, 1 + len(ColumnarCache.COLUMNS)):
+                column = self.options[name]
+                raw_options = {}        # stored value -> (bitset, option codes)
+                added = {}
+                for position, row in enumerate(rows, base):
+                    value = row[i]
+                    entry = raw_options.get(value)
+                    if entry is None:
+                        codes = sorted({column.code_for(option) for option in split_options(value)})
+                        entry = raw_options[value] = (sum(1 << code for code in codes), codes)
+                    column.options.append(entry[0])
+                    for code in entry[1]:
+                        positions = added.get(code)
+                        if positions is None:
+                            added[code] = [position]
+                        else:
+                            positions.append(position)
+                for code, positions in added.items():
+                    column.masks[code] |= positions_mask(positions, base)
+            self.live |= ((1 << len(rows)) - 1) << base
+            for value in self.columns['session_date'].values[known_dates:]:
+                bisect.insort(self.dates, value)
 
-def backup_db():
+        def remove(self, row_id):
+            position = bisect.bisect_left(self.ids, row_id)
+            if position == len(self.ids) or self.ids[position] != row_id or not self.live >> position & 1:
+                return
+            keep = ~(1 << position)
+            self.live &= keep
+            for column in self.columns.values():
+                column.discard(column.codes[position], position, keep)
+            for column in self.options.values():
+                bitset = column.options[position]
+                while bitset:
+                    code = bitset.bit_length() - 1
+                    column.masks[code] &= keep
+                    bitset ^= 1 << code
+
+        def apply(self, updates):
+            """Replay ('add', rows) and ('remove', ids) updates in commit order."""
+            for action, payload in updates:
+                if action == 'add':
+                    self.add_rows(payload)
+                else:
+                    for row_id in payload:
+                        self.remove(row_id)
+
+        def filter_mask(self, params):
+            """Rows matching an /api/records query, or None if the cache cannot answer it."""
+            p = lambda key: params.get(key, [None])[0]
+            if p('search') or p('client_id'):
+                return None
+            mask = self.live
+            filtered = False
+
+            if p('date_from') or p('date_to'):
+                lo = bisect.bisect_left(self.dates, p('date_from')) if p('date_from') else 0
+                hi = bisect.bisect_right(self.dates, p('date_to')) if p('date_to') else len(self.dates)
+                column = self.columns['session_date']
+                mask &= column.mask_of([column.lookup[value] for value in self.dates[lo:hi]])
+                filtered = True
+
+            for field in EXACT_FILTER_FIELDS:
+                if p(field):
+                    column = self.columns[field]
+                    code = column.lookup.get(p(field))
+                    mask &= column.masks[code] if code is not None else 0
+                    filtered = True
+
+            for field in ['staff_member'] + LIKE_FILTER_FIELDS:
+                val = p(field)
+                if not val:
+                    continue
+                if field != 'staff_member' and ('%' in val or '_' in val):
+                    return None  # LIKE wildcards typed into the filter: leave those to SQLite
+                column = self.columns[field]
+                key = ascii_lower(val)
+                if field == 'staff_member':
+                    codes = [code for code, value in enumerate(column.folded) if value.startswith(key)]
+                else:
+                    codes = [code for code, value in enumerate(column.folded) if key in value]
+                matching = 0
+                for code in codes:
+                    matching |= column.masks[code]
+                mask &= matching
+                filtered = True
+
+            for field in MULTI_SELECT_FIELDS:
+                wanted = list({v.lower(): v for raw in params.get(field, []) for v in split_options(raw)}.values())
+                if not wanted:
+                    continue
+                column = self.options[field]
+                codes = [column.lookup.get(ascii_lower(v)) for v in wanted]
+                if p(f"{field}_match") == 'all' and len(wanted) > 1:
+                    for code in codes:
+                        mask &= column.masks[code] if code is not None else 0
+                else:
+                    matching = 0
+                    for code in codes:
+                        if code is not None:
+                            matching |= column.masks[code]
+                    mask &= matching
+                filtered = True
+
+            # With no filters at all SQLite's date index is already the fastest path
+            return mask if filtered else None
+
+        def date_masks(self):
+            column = self.columns['session_date']
+            return [(value, column.masks[column.lookup[value]]) for value in self.dates]
+
+    SELECT_COLUMNS = ', '.join(['id'] + COLUMNS + MULTI_SELECT_FIELDS)
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._store = None
+        self._pending = None            # writes seen while a build is running, replayed after it
+        self._build_id = 0
+        self._failed = False
+        self._staged = []               # (action, ids) of the open write_transaction(), under _write_lock
+
+    @property
+    def ready(self):
+        return self._store is not None
+
+    def rebuild(self):
+        """Discard the cache and rebuild it from the database; returns the background thread."""
+        if not COLUMNAR_CACHE:
+            return
+        with self._lock:
+            self._store = None
+            self._pending = []
+            self._failed = False
+            self._build_id += 1
+            build_id = self._build_id
+        builder = threading.Thread(target=self._build, args=(build_id,), name='columnar-cache', daemon=True)
+        builder.start()
+        return builder
+
+    def _build(self, build_id):
+        start = time.perf_counter()
+        store = ColumnarCache.Store()
+        try:
+            conn = get_db_connection()
+            try:
+                cursor = conn.cursor()
+                cursor.row_factory = None
+                cursor.execute(f"SELECT {self.SELECT_COLUMNS} FROM submissions ORDER BY id")
+                while True:
+                    rows = cursor.fetchmany(5000)
+                    if not rows:
+                        break
+                    store.add_rows(rows)
+            finally:
+                conn.close()
+            with self._lock:
+                if build_id != self._build_id:
+                    return  # Superseded by a later rebuild()
+                store.apply(self._pending)
+                self._pending = None
+                self._store = store
+            logging.info(f"Columnar cache built: {popcount(store.live)} rows in {time.perf_counter() - start:.2f}s")
+        except Exception as e:
+            logging.error(f"Columnar cache build failed: {e}")
+            with self._lock:
+                if build_id == self._build_id:
+                    self._pending = None
+                    self._failed = True  # Stay on SQL until the next rebuild()
+
+    def _current(self):
+        """The store if it is ready, starting a build the first time it is needed."""
+        store = self._store
+        if store is None and COLUMNAR_CACHE and self._pending is None and not self._failed:
+            self.rebuild()
+        return store
+
+    def rows_added(self, ids):
+        """Note rows inserted by the open write_transaction(); they are indexed once it commits."""
+        if ids:
+            self._staged.append(('add', list(ids)))
+
+    def rows_removed(self, ids):
+        """Note rows deleted by the open write_transaction(); they are dropped once it commits."""
+        if ids:
+            self._staged.append(('remove', list(ids)))
+
+    def discard_staged(self):
+        """The transaction rolled back: forget its changes."""
+        self._staged = []
+
+    def apply_staged(self, conn):
+        """Apply the committed transaction's changes. Called by write_transaction() with _write_lock held."""
+        staged, self._staged = self._staged, []
+        if not staged or (self._store is None and self._pending is None):
+            return
+        updates = []
+        for action, ids in staged:
+            if action == 'add':
+                rows = []
+                for i in range(0, len(ids), 500):
+                    chunk = ids[i:i + 500]
+                    rows.extend(tuple(row) for row in conn.execute(
+                        f"SELECT {self.SELECT_COLUMNS} FROM submissions WHERE id IN ({', '.join(['?'] * len(chunk))}) ORDER BY id",
+                        chunk))
+                updates.append((action, rows))
+            else:
+                updates.append((action, ids))
+        with self._lock:
+            if self._pending is not None:
+                self._pending.extend(updates)
+            elif self._store is not None:
+                self._store.apply(updates)
+
+    def _select(self, params):
+        """(matching mask, date masks, ids) for a query, or None to use SQL."""
+        store = self._current()
+        if store is None:
+            METRICS.inc('womenshealth_columnar_cache_total', (('result', 'fallback'),))
+            return None
+        start = time.perf_counter()
+        with self._lock:
+            mask = store.filter_mask(params)
+            if mask is None:
+                METRICS.inc('womenshealth_columnar_cache_total', (('result', 'fallback'),))
+                return None
+            # Masks are immutable ints and date block dicts are replaced, not changed, so this
+            # snapshot stays consistent after the lock is released
+            selection = (mask, store.date_masks(), store.ids)
+        METRICS.inc('womenshealth_columnar_cache_total', (('result', 'hit'),))
+        METRICS.observe('womenshealth_columnar_filter_duration_seconds', time.perf_counter() - start)
+        return selection
+
+    @staticmethod
+    def _walk(mask, date_masks, ids, skip=0, limit=None, after_key=None):
+        """Ids of rows in `mask`, newest session_date first, then highest id first."""
+        out = []
+        if not mask or limit == 0:
+            return out
+        block_rows = ColumnarCache.DateColumn.BLOCK
+        block_bytes = block_rows // 8
+        # The filter mask cut into the same blocks, by slicing bytes rather than shifting the whole int
+        mask_bytes = mask.to_bytes((mask.bit_length() + 7) // 8, 'little')
+        mask_blocks = [int.from_bytes(mask_bytes[i:i + block_bytes], 'little')
+                       for i in range(0, len(mask_bytes), block_bytes)]
+        after_position = bisect.bisect_left(ids, after_key[1]) if after_key is not None else None
+        for value, blocks in reversed(date_masks):
+            if after_key is not None and value > after_key[0]:
+                continue
+            for block in (sorted(blocks, reverse=True) if len(blocks) > 1 else blocks):
+                if block >= len(mask_blocks):
+                    continue
+                start = block * block_rows
+                matches = blocks[block] & mask_blocks[block]
+                if after_key is not None and value == after_key[0]:
+                    matches &= (1 << max(after_position - start, 0)) - 1
+                if not matches:
+                    continue
+                if skip:
+                    count = popcount(matches)
+                    if count <= skip:
+                        skip -= count
+                        continue
+                # Within a date, higher positions are higher ids
+                while matches:
+                    top = matches.bit_length() - 1
+                    matches ^= 1 << top
+                    if skip:
+                        skip -= 1
+                        continue
+                    out.append(ids[start + top])
+                    if limit is not None and len(out) >= limit:
+                        return out
+        return out
+
+    def page(self, params, per_page, offset, after_key=None):
+        """(total, ids of one page) for /api/records, or None to use SQL.
+
+        per_page and offset act like SQL's LIMIT and OFFSET: a negative
+        limit means no limit and a negative offset counts as 0.
+        """
+        selection = self._select(params)
+        if selection is None:
+            return None
+        mask, date_masks, ids = selection
+        skip = 0 if after_key is not None else max(offset, 0)
+        limit = per_page if per_page >= 0 else None
+        return popcount(mask), self._walk(mask, date_masks, ids, skip, limit, after_key)
+
+    def row_count(self):
+        store = self._store
+        return popcount(store.live) if store is not None else 0
+
+COLUMN_CACHE = ColumnarCache()
+
+class ResultCache:
+    """LRU of finished response bodies, keyed by route, normalised query and encoding.
+
+    Entries belong to the write generation they were built under. The first
+    lookup after a write empties the cache, so a hit is always current and
+    never touches SQLite. Bounded by entry count and by body bytes.
+    """
+
+    def __init__(self, max_entries=RESULT_CACHE_ENTRIES, max_bytes=RESULT_CACHE_BYTES):
+        self.max_entries = max_entries
+        self.max_bytes = max_bytes
+        self._entries = OrderedDict()
+        self._bytes = 0
+        self._generation = None
+        self._lock = threading.Lock()
+
+    @staticmethod
+    def key(route, params, encoding):
+        """Parameter order does not matter: ?a=1&b=2 and ?b=2&a=1 share an entry."""
+        return (route, encoding, tuple(sorted((name, tuple(values)) for name, values in params.items())))
+
+    def max_entry_bytes(self):
+        return self.max_bytes // 4
+
+    def get(self, key, generation):
+        """The cached value for `key`, or None."""
+        if not self.max_entries:
+            return None
+        with self._lock:
+            entry = self._entries.get(key) if self._sync(generation) else None
+            if entry is not None:
+                self._entries.move_to_end(key)
+        METRICS.inc('womenshealth_result_cache_total', (('route', key[0]), ('result', 'miss' if entry is None else 'hit')))
+        return None if entry is None else entry[0]
+
+    def put(self, key, generation, value, size):
+        """Store a value built under `generation`, unless a write has landed since."""
+        if not self.max_entries or size > self.max_entry_bytes():
+            return
+        with self._lock:
+            if not self._sync(generation):
+                return
+            old = self._entries.pop(key, None)
+            if old is not None:
+                self._bytes -= old[1]
+            self._entries[key] = (value, size)
+            self._bytes += size
+            while len(self._entries) > self.max_entries or self._bytes > self.max_bytes:
+                _, (_, evicted) = self._entries.popitem(last=False)
+                self._bytes -= evicted
+
+    def _sync(self, generation):
+        """Empty the cache if `generation` is newer; False if it is the stale one."""
+        if self._generation is None or generation > self._generation:
+            self._entries.clear()
+            self._bytes = 0
+            self._generation = generation
+        return generation == self._generation
+
+    def __len__(self):
+        return len(self._entries)
+
+    def size_bytes(self):
+        return self._bytes
+
+RESULT_CACHE = ResultCache()
+
+def ids_where(ids):
+    """WHERE clause + params selecting exactly these submission ids."""
+    return " WHERE id IN (SELECT value FROM json_each(?))", [json.dumps(ids)]
+
+class RequestBody(io.RawIOBase):
+    """Readable stream over exactly Content-Length bytes of a request body."""
+
+    def __init__(self, rfile, length):
+        self.rfile = rfile
+        self.remaining = length
+
+    def readable(self):
+        return True
+
+    def readinto(self, buffer):
+        if self.remaining <= 0:
+            return 0
+        data = self.rfile.read(min(len(buffer), self.remaining))
+        buffer[:len(data)] = data
+        self.remaining -= len(data)
+        if not data:
+            self.remaining = -1  # Client went away before sending everything
+        return len(data)
+
+    @property
+    def incomplete(self):
+        return self.remaining != 0
+
+class ResponseStream:
+    """Write-through body writer: optional gzip, optional HTTP/1.1 chunk framing.
+
+    Only ever holds one compressor window plus whatever the caller passes
+    to write() (and at most capture_limit bytes of body when asked to keep
+    a copy), so large responses go out in constant memory.
+    """
+
+    def __init__(self, wfile, chunked=True, compress=False, capture_limit=0):
+        self.wfile = wfile
+        self.chunked = chunked
+        self.bytes_written = 0
+        self._gzip = zlib.compressobj(6, zlib.DEFLATED, 31) if compress else None
+        # The encoded body, kept while it fits in capture_limit bytes; None once it does not
+        self.captured = [] if capture_limit else None
+        self._capture_limit = capture_limit
+
+    def write(self, data):
+        if self._gzip is not None:
+            data = self._gzip.compress(data)
+        self._send(data)
+
+    def _send(self, data):
+        if not data:
+            return
+        if self.captured is not None:
+            if self.bytes_written + len(data) <= self._capture_limit:
+                self.captured.append(data)
+            else:
+                self.captured = None
+        if self.chunked:
+            self.wfile.write(f"{len(data):X}\r\n".encode('ascii') + data + b"\r\n")
+        else:
+            self.wfile.write(data)
+        self.bytes_written += len(data)
+
+    def close(self):
+        if self._gzip is not None:
+            self._send(self._gzip.flush())
+            self._gzip = None
+        if self.chunked:
+            self.wfile.write(b"0\r\n\r\n")
+        self.wfile.flush()
+
+def prepare_restore_file(path):
+    """Check an uploaded database and bring it up to the current schema.
+
+    Returns an error message for the user, or None if the file is ready to
+    be copied over the live database.
+    """
+    try:
+        conn = sqlite3.connect(path)
+        conn.row_factory = sqlite3.Row
+    except sqlite3.Error:
+        return "Invalid database file format"
+    try:
+        result = conn.execute("PRAGMA integrity_check").fetchone()[0]
+        if result != 'ok':
+            logging.error(f"Restore rejected, integrity_check: {result}")
+            return "Database file failed its integrity check"
+        if conn.execute("SELECT 1 FROM sqlite_master WHERE type = 'table' AND name = 'submissions'").fetchone() is None:
+            return "Database file has no submissions table"
+
+        # The backup API cannot copy into a WAL database with a different
+        # page size, so normalise the upload to match the live file.
+        conn.execute('PRAGMA journal_mode=DELETE')
+        live = get_db_connection()
+        try:
+            page_size = live.execute('PRAGMA page_size').fetchone()[0]
+        finally:
+            live.close()
+        if conn.execute('PRAGMA page_size').fetchone()[0] != page_size:
+            conn.execute(f'PRAGMA page_size={int(page_size)}')
+            conn.execute('VACUUM')
+
+        # The backup may predate the search index or rollups
+        ensure_schema(conn)
+        rebuild_search_index(conn.cursor())
+        conn.commit()
+        return None
+    except sqlite3.DatabaseError as e:
+        logging.error(f"Restore rejected: {e}")
+        return "Database file failed its integrity check"
+    finally:
+        conn.close()
+
+def backup_db(prefix='womenshealth_backup', keep=5):
+    """Copy the live database into backups/ using the online backup API.
+
+    Pages are copied BACKUP_PAGES_PER_STEP at a time with a short pause
+    between steps, so requests keep running, and anything still in the
+    -wal file is included. Only the newest `keep` files per prefix are kept.
+    """
     try:
         if not os.path.exists(DB_PATH):
             return
-            
-        import shutil
+
         import glob
-        
+
         backup_dir = os.path.join(APP_DIR, 'backups')
         if not os.path.exists(backup_dir):
             os.makedirs(backup_dir)
-            
+
         timestamp = datetime.now().strftime('%Y%m%d_%H%M%S')
-        backup_file = os.path.join(backup_dir, f'womenshealth_backup_{timestamp}.db')
-        
-        shutil.copy2(DB_PATH, backup_file)
+        backup_file = os.path.join(backup_dir, f'{prefix}_{timestamp}.db')
+
+        source = get_db_connection()
+        target = sqlite3.connect(backup_file)
+        try:
+            source.backup(target, pages=BACKUP_PAGES_PER_STEP, sleep=BACKUP_STEP_SLEEP)
+        finally:
+            target.close()
+            source.close()
         logging.info(f"Database backed up to {backup_file}")
-        
-        # Keep only the last 5 copies
-        backups = sorted(glob.glob(os.path.join(backup_dir, 'womenshealth_backup_*.db')))
-        if len(backups) > 5:
-            for old_backup in backups[:-5]:
+
+        # Keep only the last few copies
+        backups = sorted(glob.glob(os.path.join(backup_dir, f'{prefix}_*.db')))
+        if len(backups) > keep:
+            for old_backup in backups[:-keep]:
                 try:
                     os.remove(old_backup)
                     logging.info(f"Removed old backup: {old_backup}")
@@ -480,6 +3075,95 @@ def backup_db():
     except Exception as e:
         logging.error(f"Error during backup: {e}")
 
+class BackupScheduler(threading.Thread):
+    """Takes an online backup every BACKUP_INTERVAL_MINUTES while data is changing."""
+
+    def __init__(self, interval_minutes=BACKUP_INTERVAL_MINUTES):
+        super().__init__(name="backup-scheduler", daemon=True)
+        self.interval = interval_minutes * 60
+        self._stop_event = threading.Event()
+        self._backed_up_generation = _write_generation
+
+    def run(self):
+        while not self._stop_event.wait(self.interval):
+            generation = _write_generation
+            if generation == self._backed_up_generation:
+                continue  # Nothing written since the last copy
+            backup_db(prefix='womenshealth_auto', keep=BACKUP_KEEP_PERIODIC)
+            self._backed_up_generation = generation
+
+    def stop(self):
+        self._stop_event.set()
+
+class PooledHTTPServer(socketserver.TCPServer):
+    """TCPServer that hands accepted connections to a fixed pool of worker threads.
+
+    Connections wait in a bounded queue; once it is full new clients get an
+    immediate 503 rather than piling up behind a slow export or restore.
+    """
+
+    def __init__(self, server_address, handler_class, workers=WORKER_THREADS, queue_size=REQUEST_QUEUE_SIZE):
+        self._pending = queue.Queue(maxsize=queue_size)
+        self._workers = []
+        self._idle_workers = 0
+        self._idle_lock = threading.Lock()
+        super().__init__(server_address, handler_class)
+        for i in range(workers):
+            worker = threading.Thread(target=self._worker_loop, name=f"worker-{i + 1}", daemon=True)
+            worker.start()
+            self._workers.append(worker)
+
+    def process_request(self, request, client_address):
+        try:
+            self._pending.put_nowait((request, client_address))
+        except queue.Full:
+            logging.warning(f"Request queue full, rejecting connection from {client_address[0]}")
+            try:
+                request.sendall(
+                    b"HTTP/1.0 503 Service Unavailable\r\n"
+                    b"Content-Type: application/json\r\n"
+                    b"Retry-After: 1\r\n"
+                    b"Connection: close\r\n\r\n"
+                    b'{"status": "error", "message": "Server busy, please retry"}'
+                )
+            except OSError:
+                pass
+            self.shutdown_request(request)
+
+    def has_waiting_connections(self):
+        """True when queued connections outnumber the workers free to take them."""
+        return self._pending.qsize() > self._idle_workers
+
+    def _worker_loop(self):
+        while True:
+            with self._idle_lock:
+                self._idle_workers += 1
+            item = self._pending.get()
+            with self._idle_lock:
+                self._idle_workers -= 1
+            if item is None:
+                break
+            request, client_address = item
+            try:
+                self.finish_request(request, client_address)
+            except Exception:
+                self.handle_error(request, client_address)
+            finally:
+                self.shutdown_request(request)
+        close_thread_connection()
+
+    def server_close(self):
+        super().server_close()
+        for _ in self._workers:
+            self._pending.put(None)
+        for worker in self._workers:
+            worker.join(timeout=5)
+
+def make_server(host=HOST, port=PORT):
+    if WORKER_THREADS > 0:
+        return PooledHTTPServer((host, port), WomensHealthHandler)
+    return socketserver.TCPServer((host, port), WomensHealthHandler)
+
 def run_server():
     if not acquire_app_lock():
         try:
@@ -494,15 +3178,25 @@ def run_server():
         sys.exit(1)
 
     init_db()
+    OPTION_INDEX.fields()  # Build the typeahead index before the first request needs it
+    COLUMN_CACHE.rebuild()  # In the background; filters use SQL until it is ready
     
     # Port conflict detection
     try:
-        server = socketserver.TCPServer((HOST, PORT), WomensHealthHandler)
+        server = make_server()
         print(f"Server started at http://{HOST}:{PORT}")
-        logging.info(f"Server started at http://{HOST}:{PORT}")
+        logging.info(f"Server started at http://{HOST}:{PORT} ({WORKER_THREADS or 'no'} worker threads)")
+        scheduler = None
+        if BACKUP_INTERVAL_MINUTES > 0:
+            scheduler = BackupScheduler()
+            scheduler.start()
         try:
             server.serve_forever()
         finally:
+            if scheduler is not None:
+                scheduler.stop()
+            release_change_waiters()
+            server.server_close()
             backup_db()
             print("Database backed up. Server shutdown gracefully.")
             logging.info("Server graceful shutdown complete.")
@@ -516,5 +3210,218 @@ def run_server():
             logging.error(f"Unexpected error: {e}")
             sys.exit(1)
 
+def rebuild_search_index_command():
+    """One-off: repopulate the FTS5 index from the submissions table."""
+    init_db()
+    conn = get_db_connection()
+    try:
+        rebuild_search_index(conn.cursor())
+        conn.commit()
+        total = conn.execute("SELECT COUNT(*) AS total FROM submissions").fetchone()['total']
+    finally:
+        conn.close()
+    print(f"Search index rebuilt for {total} records.")
+    logging.info(f"Search index rebuilt for {total} records.")
+
+def archive_command(cutoff=None):
+    """One-off: move sessions dated before `cutoff` into archive/womenshealth_<year>.db.
+
+    The default cutoff keeps ARCHIVE_KEEP_YEARS calendar years in the live
+    file. Runs with the app stopped and takes a backup first. Each year is
+    copied, then deleted from the live file; a crash in between leaves the
+    rows in both, and running the command again finishes the move.
+    """
+    if cutoff is None:
+        cutoff = f"{datetime.now().year - ARCHIVE_KEEP_YEARS + 1}-01-01"
+    try:
+        datetime.strptime(cutoff, '%Y-%m-%d')
+    except ValueError:
+        print(f"Error: cutoff '{cutoff}' is not a YYYY-MM-DD date.")
+        sys.exit(1)
+    if not acquire_app_lock():
+        print("Error: the app is running. Stop it before archiving.")
+        sys.exit(1)
+
+    init_db()
+    backup_db(prefix='womenshealth_pre_archive', keep=3)
+    os.makedirs(ARCHIVE_DIR, exist_ok=True)
+    conn = get_db_connection()
+    try:
+        years = [row[0] for row in conn.execute(
+            "SELECT DISTINCT substr(session_date, 1, 4) FROM submissions"
+            " WHERE session_date < ? AND session_date GLOB '[0-9][0-9][0-9][0-9]-*' ORDER BY 1", (cutoff,))]
+        columns = ', '.join(ARCHIVE_COLUMNS)
+        for year in years:
+            path = archive_path(year)
+            archive = sqlite3.connect(path)
+            archive.row_factory = sqlite3.Row
+            try:
+                ensure_schema(archive)  # Same tables, search index and rollups as the live file
+            finally:
+                archive.close()
+
+            start, end = f"{year}-01-01", min(cutoff, f"{int(year) + 1}-01-01")
+            conn.execute("ATTACH DATABASE ? AS archive", (path,))
+            try:
+                conn.execute('BEGIN IMMEDIATE')
+                try:
+                    conn.execute(
+                        f"INSERT OR IGNORE INTO archive.submissions ({columns})"
+                        f" SELECT {columns} FROM main.submissions WHERE session_date >= ? AND session_date < ? ORDER BY id",
+                        (start, end))
+                    conn.execute(
+                        "INSERT OR IGNORE INTO archive.submission_options (submission_id, field, value)"
+                        " SELECT o.submission_id, o.field, o.value FROM main.submission_options o"
+                        " JOIN main.submissions s ON s.id = o.submission_id WHERE s.session_date >= ? AND s.session_date < ?",
+                        (start, end))
+                    moved = conn.execute("DELETE FROM main.submissions WHERE session_date >= ? AND session_date < ?",
+                                         (start, end)).rowcount
+                    conn.execute("DELETE FROM archive.change_log")  # Its own triggers logged the copy; nothing reads it
+                    conn.commit()
+                except Exception:
+                    conn.rollback()
+                    raise
+            finally:
+                conn.execute("DETACH DATABASE archive")
+            print(f"{year}: {moved} sessions moved to {path}")
+            logging.info(f"Archived {moved} sessions from {year} to {path}")
+
+        if years:
+            with conn:
+                log_change_reset(conn)
+            # Merge away the search index's delete markers, then hand the freed
+            # pages back so the live file, and every backup of it, shrinks
+            conn.execute("INSERT INTO submissions_fts(submissions_fts) VALUES ('optimize')")
+            conn.commit()
+            conn.execute('VACUUM')
+        remaining = conn.execute("SELECT COUNT(*) AS total FROM submissions").fetchone()['total']
+    finally:
+        conn.close()
+    print(f"Sessions before {cutoff} archived; {remaining} remain in {os.path.basename(DB_PATH)}.")
+    if years:
+        print(f"Include {ARCHIVE_DIR} in your backups: the app only reads it, so it changes only when you archive.")
+
+# Filter sets covering each kind of clause _build_where_clause can emit, with values the form offers
+EXPLAIN_SAMPLES = [
+    ("no filters", ""),
+    ("date range + contact mode + age",
+     "date_from=2024-01-01&date_to=2024-12-31&contact_mode=Attend+Centre+Appointment&age=30-34"),
+    ("client id / staff prefix", "client_id=C-00123&staff_member=Jane"),
+    ("funding stream + flags", "funding_stream=Health+%26+Wellbeing&carer=Yes"),
+    ("multi-select, all of", "presenting_issues=Alcohol|Cannabis&presenting_issues_match=all"),
+    ("free-text search", "search=anx+appointment"),
+    ("free-text search, ranked", "search=anx&sort=relevance"),
+]
+EXPLAIN_CLIENT_ID = 'C-00123'
+EXPLAIN_DATE_RANGE = ('2024-01-01', '2024-12-31')
+EXPLAIN_OPTION_FIELDS = ['presenting_issues', 'contact_mode']  # One per usage query shape
+
+def print_query_plan(conn, label, sql, bind):
+    sql_text = ' '.join(sql.split())
+    print(f"  {label}: {sql_text if len(sql_text) <= 200 else sql_text[:197] + '...'}")
+    rows = conn.execute(f"EXPLAIN QUERY PLAN {sql}", bind).fetchall()
+    depth = {0: 0}
+    for node_id, parent, _, detail in rows:
+        depth[node_id] = depth.get(parent, 0) + 1
+        print(f"  {'    ' * depth[node_id]}{detail}")
+
+@contextmanager
+def explain_archive_schemas(conn):
+    """Attached archive schemas to plan the UNION ALL queries against.
+
+    The newest archive years if there are any, else one empty archive built
+    the way --archive builds them, detached and removed afterwards.
+    """
+    years = archive_years()
+    if years:
+        yield attach_archives(conn, years[-ARCHIVE_ATTACH_LIMIT:])
+        return
+    with tempfile.TemporaryDirectory(prefix='womenshealth_explain_') as scratch:
+        path = os.path.join(scratch, 'womenshealth_explain.db')
+        archive = sqlite3.connect(path)
+        archive.row_factory = sqlite3.Row
+        try:
+            ensure_schema(archive)
+        finally:
+            archive.close()
+        conn.execute("ATTACH DATABASE ? AS archive_explain", (path,))
+        try:
+            yield ['archive_explain']
+        finally:
+            conn.execute("DETACH DATABASE archive_explain")
+
+def explain_queries_command(query_str=None):
+    """Print EXPLAIN QUERY PLAN for every query the server builds.
+
+    Uses EXPLAIN_SAMPLES, or a single query string given on the command
+    line (same parameters as /api/records). Filtered pages are also planned
+    across archive files; the client, change feed and option usage queries
+    follow the samples.
+    """
+    init_db()
+    conn = get_db_connection()
+    samples = [("command line", query_str)] if query_str is not None else EXPLAIN_SAMPLES
+    keyset = ('2024-06-30', 1000)
+    try:
+        with explain_archive_schemas(conn) as archives:
+            schemas = ['main'] + archives
+            for name, sample in samples:
+                params = urllib.parse.parse_qs(sample)
+                print(f"== {name}: ?{sample}")
+                where_str, query_params = WomensHealthHandler._build_where_clause(params)
+                print_query_plan(conn, "count", count_query(where_str), query_params)
+                sql, bind, ranked = WomensHealthHandler._records_page_query(params, where_str, query_params, 50, 500)
+                print_query_plan(conn, "page (offset)", sql, bind)
+                if not ranked:
+                    sql, bind, _ = WomensHealthHandler._records_page_query(
+                        params, where_str, query_params, 50, 0, keyset)
+                    print_query_plan(conn, "page (keyset)", sql, bind)
+                print_query_plan(conn, "export", WomensHealthHandler._export_query(where_str), query_params)
+                sql, bind = WomensHealthHandler._live_stats_query(params)
+                print_query_plan(conn, "stats (live)", sql, bind)
+                sql, bind, ranked = WomensHealthHandler._partitioned_page_query(params, schemas, 50, 500)
+                print_query_plan(conn, "page with archives (offset)", sql, bind)
+                if not ranked:
+                    sql, bind, _ = WomensHealthHandler._partitioned_page_query(params, schemas, 50, 0, keyset)
+                    print_query_plan(conn, "page with archives (keyset)", sql, bind)
+                print()
+            if query_str is not None:
+                return
+
+            date_from, date_to = EXPLAIN_DATE_RANGE
+            print(f"== client history: /api/client/{EXPLAIN_CLIENT_ID}")
+            for table in ['submissions'] + [f"{schema}.submissions" for schema in archives[:1]]:
+                for label, (sql, bind) in zip(("summary", "latest profile", "sessions"),
+                                              WomensHealthHandler._client_history_queries(table, EXPLAIN_CLIENT_ID)):
+                    print_query_plan(conn, f"{label} ({table})", sql, bind)
+            print()
+            print(f"== client summary: ?date_from={date_from}&date_to={date_to}")
+            print_query_plan(conn, "live file", *WomensHealthHandler._client_summary_query(date_from, date_to))
+            for schema in ('main', archives[0]):
+                range_query, before_query = WomensHealthHandler._client_summary_scan_queries(schema, date_from, date_to)
+                print_query_plan(conn, f"with archives, clients in range ({schema})", *range_query)
+                print_query_plan(conn, f"with archives, clients before ({schema})", *before_query)
+            print()
+            print("== change feed: /api/changes?since=0")
+            print_query_plan(conn, "events", CHANGES_QUERY, (0, CHANGES_PAGE_LIMIT + 1))
+            where_str, query_params = ids_where([1, 2, 3])
+            print_query_plan(conn, "changed rows", WomensHealthHandler._changed_rows_query(where_str), query_params)
+            print()
+            print("== option usage: /api/options/<field>?q=")
+            for field in EXPLAIN_OPTION_FIELDS:
+                print_query_plan(conn, field, *OptionIndex.usage_query(field))
+            print()
+    finally:
+        conn.close()
+
 if __name__ == "__main__":
-    run_server()
+    if '--rebuild-search-index' in sys.argv[1:]:
+        rebuild_search_index_command()
+    elif '--archive' in sys.argv[1:]:
+        rest = sys.argv[sys.argv.index('--archive') + 1:]
+        archive_command(rest[0] if rest else None)
+    elif '--explain' in sys.argv[1:]:
+        rest = sys.argv[sys.argv.index('--explain') + 1:]
+        explain_queries_command(rest[0] if rest else None)
+    else:
+        run_server()
@@ -0,0 +1,173 @@
+"""Differential test: the columnar cache must pick exactly the rows SQLite does.
+
+Random filter and paging combinations are answered by COLUMN_CACHE.page()
+and by the SQL the server falls back to, over generated data, before and
+after writes (including a rolled-back one).
+
+Run with:  python -m unittest discover tests   (or pytest)
+"""
+import logging
+import os
+import random
+import shutil
+import sys
+import tempfile
+import unittest
+import urllib.parse
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+# Configured first, so server's own basicConfig() is a no-op and the app's server.log is left alone
+logging.basicConfig(handlers=[logging.NullHandler()])
+import server
+
+STAFF = ['Jane Doe', 'jane Smith', 'Mary Jones', 'Aroha Ngata', 'Priya Patel']
+VALUES = {
+    'age': ['18-24', '25-34', '35-44', '65+'],
+    'contact_mode': ['Face to face', 'Phone', 'Video'],
+    'funding_stream': ['Core', 'Grant A', ''],
+    'client_status': ['New', 'Returning'],
+    'visit_number': ['1', '2', '3', '12'],
+    'carer': ['Yes', 'No'],
+    'country': ['New Zealand', 'Australia', 'India', 'new caledonia', ''],
+    'language': ['English', 'Hindi', 'Te Reo Maori'],
+}
+OPTIONS = {
+    'ethnicity': ['Maori', 'Pacific', 'Asian', 'European'],
+    'presenting_issues': ['Anxiety', 'Depression', 'Alcohol', 'Gambling', 'Housing'],
+    'service_type': ['Counselling', 'Group', 'Advocacy'],
+}
+DATES = [f"2024-{month:02d}-{day:02d}" for month in range(1, 13) for day in (3, 11, 19, 27)]
+
+def random_record(rnd):
+    record = {
+        'session_date': rnd.choice(DATES),
+        'client_id': f"C{rnd.randint(1, 300)}",
+        'staff_member': rnd.choice(STAFF),
+    }
+    for field, choices in VALUES.items():
+        record[field] = rnd.choice(choices)
+    for field, choices in OPTIONS.items():
+        record[field] = rnd.sample(choices, rnd.randint(0, 3))
+    return record
+
+def random_query(rnd):
+    query = {}
+    for _ in range(rnd.randint(1, 3)):
+        kind = rnd.random()
+        if kind < 0.2:
+            date_from, date_to = sorted(rnd.sample(DATES, 2))
+            if rnd.random() < 0.3:
+                date_from = date_from[:7]  # Partial dates compare as text, like SQLite
+            query['date_from'], query['date_to'] = date_from, date_to
+        elif kind < 0.35:
+            query['staff_member'] = rnd.choice(STAFF)[:rnd.randint(1, 6)].upper()
+        elif kind < 0.6:
+            field = rnd.choice(list(VALUES))
+            value = rnd.choice([v for v in VALUES[field] if v] + ['Nothing'])
+            if field in server.LIKE_FILTER_FIELDS:
+                start = rnd.randint(0, len(value) - 1)
+                value = value[start:start + rnd.randint(1, 4)].swapcase()
+            query[field] = value
+        else:
+            field = rnd.choice(list(OPTIONS))
+            picked = rnd.sample(OPTIONS[field] + ['Unknown'], rnd.randint(1, 3))
+            query[field] = '|'.join(v.lower() if rnd.random() < 0.3 else v for v in picked)
+            if rnd.random() < 0.5:
+                query[f"{field}_match"] = 'all'
+    return urllib.parse.parse_qs(urllib.parse.urlencode(query))
+
+class ColumnarCacheDifferentialTest(unittest.TestCase):
+
+    def setUp(self):
+        self.tmp = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, self.tmp, ignore_errors=True)
+        for name, value in (('DB_PATH', os.path.join(self.tmp, 'test.db')),
+                            ('ARCHIVE_DIR', os.path.join(self.tmp, 'archive')),
+                            ('COLUMNAR_CACHE', True),
+                            ('COLUMN_CACHE', server.ColumnarCache())):
+            self.addCleanup(setattr, server, name, getattr(server, name))
+            setattr(server, name, value)
+        # Small blocks so every date's rows span several of them
+        self.addCleanup(setattr, server.ColumnarCache.DateColumn, 'BLOCK', server.ColumnarCache.DateColumn.BLOCK)
+        server.ColumnarCache.DateColumn.BLOCK = 64
+        server.reset_connections()
+        self.addCleanup(server.close_thread_connection)
+        server.init_db()
+
+        self.rnd = random.Random(16)
+        with server.write_transaction() as conn:
+            server.insert_submissions(conn, [server.prepare_submission(random_record(self.rnd))
+                                             for _ in range(1500)])
+        self.cache = server.COLUMN_CACHE
+        self.cache.rebuild().join()
+        self.assertTrue(self.cache.ready)
+
+    def sql_ids(self, params):
+        where_str, query_params = server.WomensHealthHandler._build_where_clause(params)
+        conn = server.get_thread_connection()
+        return [row[0] for row in conn.execute(
+            f"SELECT id FROM submissions{where_str} ORDER BY session_date DESC, id DESC", query_params)]
+
+    def sql_page(self, params, per_page, offset, after_key=None):
+        """Ids of the page the SQL path of /api/records would return."""
+        where_str, query_params = server.WomensHealthHandler._build_where_clause(params)
+        records_query, records_params, _ = server.WomensHealthHandler._records_page_query(
+            params, where_str, query_params, per_page, offset, after_key)
+        cursor = server.get_thread_connection().execute(records_query, records_params)
+        id_column = [d[0] for d in cursor.description].index('id')
+        return [row[id_column] for row in cursor]
+
+    def assert_matches_sql(self, queries=300):
+        conn = server.get_thread_connection()
+        answered = 0
+        for _ in range(queries):
+            params = random_query(self.rnd)
+            # Zero and negative values too: the cache must treat them as LIMIT/OFFSET do
+            per_page = self.rnd.choice([-1, 0, 1, 7, 50])
+            offset = self.rnd.choice([-5, 0, per_page, self.rnd.randint(0, 400)])
+            cached = self.cache.page(params, per_page, offset)
+            if cached is None:
+                continue
+            answered += 1
+            total = len(self.sql_ids(params))
+            self.assertEqual(cached, (total, self.sql_page(params, per_page, offset)), (params, per_page, offset))
+            # Keyset paging from a row in the middle of the result
+            if total > 1:
+                row_id = self.sql_page(params, 1, self.rnd.randrange(total - 1))[0]
+                session_date = conn.execute("SELECT session_date FROM submissions WHERE id = ?",
+                                            (row_id,)).fetchone()[0]
+                _, page_ids = self.cache.page(params, per_page, 0, (session_date, row_id))
+                self.assertEqual(page_ids, self.sql_page(params, per_page, 0, (session_date, row_id)),
+                                 (params, per_page))
+        self.assertGreater(answered, queries // 2)
+
+    def test_filters_and_paging_match_sql(self):
+        self.assert_matches_sql()
+
+    def test_writes_and_rollback(self):
+        conn = server.get_thread_connection()
+        removed = [row[0] for row in conn.execute("SELECT id FROM submissions ORDER BY random() LIMIT 200")]
+        with server.write_transaction() as conn:
+            conn.execute(f"DELETE FROM submissions WHERE id IN ({', '.join(['?'] * len(removed))})", removed)
+            self.cache.rows_removed(removed)
+            added = server.insert_submissions(conn, [server.prepare_submission(random_record(self.rnd))
+                                                     for _ in range(300)])
+            self.cache.rows_added(added)
+        self.assert_matches_sql()
+
+        everything = urllib.parse.parse_qs('date_from=2000-01-01')
+        before = self.cache.page(everything, 10, 0)
+        generation = server._write_generation
+        with self.assertRaises(RuntimeError):
+            with server.write_transaction() as conn:
+                ids = server.insert_submissions(conn, [server.prepare_submission(random_record(self.rnd))])
+                self.cache.rows_added(ids)
+                # Not visible until the transaction commits
+                self.assertEqual(self.cache.page(everything, 10, 0), before)
+                raise RuntimeError('roll back')
+        self.assertEqual(self.cache.page(everything, 10, 0), before)
+        self.assertGreater(server._write_generation, generation)
+        self.assert_matches_sql(100)
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,81 @@
+"""CSV import checks every fixed-choice field against data.json, the same list the form is built from.
+
+Run with:  python -m unittest discover tests   (or pytest)
+"""
+import logging
+import os
+import sys
+import unittest
+from html.parser import HTMLParser
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+# Configured first, so server's own basicConfig() is a no-op and the app's server.log is left alone
+logging.basicConfig(handlers=[logging.NullHandler()])
+import server
+
+# Typed in by hand on the form; everything else is picked from a list
+FREE_TEXT_FIELDS = {'session_date', 'client_id', 'staff_member', 'visit_number'}
+
+class FormSelects(HTMLParser):
+    """Option values written into each <select> of the form, by field name."""
+
+    def __init__(self):
+        super().__init__()
+        self.options = {}
+        self._select = None
+
+    def handle_starttag(self, tag, attrs):
+        attrs = dict(attrs)
+        if tag == 'select':
+            self._select = attrs.get('name') or attrs.get('id')
+            self.options[self._select] = []
+        elif tag == 'option' and self._select:
+            self.options[self._select].append(attrs.get('value', ''))
+
+    def handle_endtag(self, tag):
+        if tag == 'select':
+            self._select = None
+
+class ImportValidationTest(unittest.TestCase):
+
+    def setUp(self):
+        self.vocabularies = server.import_vocabularies()
+
+    def valid_record(self):
+        record = {'session_date': '2025-03-04', 'client_id': 'C1', 'staff_member': 'Jane Doe', 'visit_number': '2'}
+        for field, vocabulary in self.vocabularies.items():
+            record[field] = next(iter(vocabulary.values()))
+        return record
+
+    def test_every_fixed_choice_field_has_a_vocabulary(self):
+        self.assertEqual(set(self.vocabularies), set(server.SUBMISSION_FIELDS) - FREE_TEXT_FIELDS)
+
+    def test_form_lists_no_options_of_its_own(self):
+        # Any list written into the HTML would be a second copy that import does not see
+        parser = FormSelects()
+        with open(server.HTML_FORM_PATH, encoding='utf-8') as f:
+            parser.feed(f.read())
+        for field, values in parser.options.items():
+            if field in server.SUBMISSION_FIELDS:
+                self.assertEqual([v for v in values if v], [], field)
+
+    def test_valid_row_is_saved_in_data_json_spelling(self):
+        record = self.valid_record()
+        record['carer'] = 'yes'
+        record['funding_stream'] = 'health & wellbeing'
+        values = server.prepare_import_row(record, self.vocabularies)
+        saved = dict(zip(server.SUBMISSION_FIELDS, values))
+        self.assertEqual(saved['carer'], 'Yes')
+        self.assertEqual(saved['funding_stream'], 'Health & Wellbeing')
+
+    def test_invalid_value_is_rejected_for_each_field(self):
+        server.prepare_import_row(self.valid_record(), self.vocabularies)
+        for field in self.vocabularies:
+            with self.subTest(field=field):
+                record = self.valid_record()
+                record[field] = 'Not an option'
+                with self.assertRaisesRegex(ValueError, f"^{field}: 'Not an option'"):
+                    server.prepare_import_row(record, self.vocabularies)
+
+if __name__ == '__main__':
+    unittest.main()
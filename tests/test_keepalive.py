@@ -0,0 +1,63 @@
+"""HTTP/1.1 keep-alive: requests sent back to back on one connection are all answered.
+
+Run with:  python -m unittest discover tests   (or pytest)
+"""
+import logging
+import os
+import shutil
+import socket
+import sys
+import tempfile
+import threading
+import unittest
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+# Configured first, so server's own basicConfig() is a no-op and the app's server.log is left alone
+logging.basicConfig(handlers=[logging.NullHandler()])
+import server
+
+def read_response(stream):
+    """(status, body) of one Content-Length response read from a socket file."""
+    status = int(stream.readline().split()[1])
+    length = 0
+    while True:
+        line = stream.readline()
+        if line in (b'\r\n', b''):
+            break
+        name, _, value = line.decode('latin-1').partition(':')
+        if name.strip().lower() == 'content-length':
+            length = int(value)
+    return status, stream.read(length)
+
+class KeepAliveTest(unittest.TestCase):
+
+    def setUp(self):
+        tmp = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, tmp, ignore_errors=True)
+        for name, value in (('DB_PATH', os.path.join(tmp, 'test.db')),
+                            ('ARCHIVE_DIR', os.path.join(tmp, 'archive')),
+                            ('COLUMN_CACHE', server.ColumnarCache())):
+            self.addCleanup(setattr, server, name, getattr(server, name))
+            setattr(server, name, value)
+        server.reset_connections()
+        server.init_db()
+        httpd = server.make_server('127.0.0.1', 0)
+        self.addCleanup(httpd.server_close)
+        thread = threading.Thread(target=httpd.serve_forever, daemon=True)
+        thread.start()
+        self.addCleanup(thread.join)
+        self.addCleanup(httpd.shutdown)
+        self.port = httpd.server_address[1]
+
+    def test_pipelined_requests_in_one_send(self):
+        request = b'GET /api/records?per_page=1 HTTP/1.1\r\nHost: localhost\r\n\r\n'
+        with socket.create_connection(('127.0.0.1', self.port)) as sock:
+            # Well under KEEPALIVE_TIMEOUT: a request left in the read buffer would time out here
+            sock.settimeout(5)
+            sock.sendall(request * 2)
+            stream = sock.makefile('rb')
+            self.assertEqual(read_response(stream)[0], 200)
+            self.assertEqual(read_response(stream)[0], 200)
+
+if __name__ == '__main__':
+    unittest.main()